@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Measures Consolidator.consolidate on synthetic sweeps.
+Each trial graph binds two literals, a (NUM_A values) and b, and runs:
+    a -> prepare -> x -> fit(x, b) -> y
+so prepare is shared by the trials with the same a, and fit is distinct in every trial.
+The reported time per node should stay flat as the number of trials grows,
+and drop with the number of worker processes of the tree reduction.
+The consolidated graph of the smallest sweep is then executed, and its outputs checked,
+    with chunks of CHECK_CHUNK_SIZE graphs so the tree reduction has several levels.
+
+Usage: python benchmarks/consolidation_scaling.py [--parallelism N] [num_trials ...]
+"""
+import sys
+import time
+
+from flor.experiment_graph import ExperimentGraph
+from flor.light_object_model import *
+from flor.engine.consolidator import Consolidator
+from flor.engine.executor import Executor
+
+NUM_A = 10
+CHECK_CHUNK_SIZE = 7
+
+
+def prepare(a, **kwargs):
+    return {'x': a}
+
+
+def fit(x, b, **kwargs):
+    return {'y': x * b}
+
+
+def trial_graph(trial_index):
+    """
+    Builds the experiment graph of one trial, as Expander.expand would
+    """
+    eg = ExperimentGraph()
+    a = LiteralLight(trial_index % NUM_A, 'a')
+    b = LiteralLight(trial_index // NUM_A, 'b')
+    do_prepare = ActionLight('prepare', prepare)
+    x = LiteralLight(None, 'x')
+    do_fit = ActionLight('fit', fit)
+    y = LiteralLight(None, 'y')
+    for node in (a, b, do_prepare, x, do_fit, y):
+        eg.light_node(node)
+    for u, v in ((a, do_prepare), (do_prepare, x), (x, do_fit), (b, do_fit), (do_fit, y)):
+        eg.edge(u, v)
+    return eg
+
+
+def main(sizes, parallelism=1):
+    print("{:>10} {:>10} {:>12} {:>14}".format("trials", "nodes", "seconds", "usec/node"))
+    for n in sizes:
+        experiment_graphs = [trial_graph(i) for i in range(n)]
+        num_nodes = sum(len(eg.d) for eg in experiment_graphs)
+        start = time.perf_counter()
+        Consolidator.consolidate(experiment_graphs, parallelism)
+        elapsed = time.perf_counter() - start
+        print("{:>10} {:>10} {:>12.4f} {:>14.2f}".format(n, num_nodes, elapsed, 1e6 * elapsed / num_nodes))
+    check(min(sizes), parallelism)
+
+
+def check(num_trials, parallelism):
+    """
+    Executes the consolidated graph, which must produce y = a * b for every trial
+    """
+    eg = Consolidator.consolidate((trial_graph(i) for i in range(num_trials)), parallelism, CHECK_CHUNK_SIZE)
+    Executor.execute(eg, mode='thread')
+    ys = sorted(v.v for v in eg.d if type(v) == LiteralLight and v.name == 'y')
+    expected = sorted((i % NUM_A) * (i // NUM_A) for i in range(num_trials))
+    assert ys == expected, "The consolidated graph computed {} instead of {}".format(ys, expected)
+    print("executed {} trials".format(num_trials))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    parallelism = 1
+    if args[:1] == ['--parallelism']:
+        parallelism = int(args[1])
+        args = args[2:]
+    main([int(i) for i in args] or [10, 100, 1000, 10000], parallelism)
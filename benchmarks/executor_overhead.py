@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Measures the scheduling overhead of Executor.execute on synthetic graphs.
+Every action is a no-op, so the reported time per action is pure engine overhead,
+which should stay flat as the graph grows.
+
+Usage: python benchmarks/executor_overhead.py [num_actions ...]
+"""
+import sys
+import time
+
+from flor.experiment_graph import ExperimentGraph
+from flor.light_object_model import *
+from flor.engine.executor import Executor
+
+CHAIN_LENGTH = 10
+
+
+def increment(x, **kwargs):
+    return {'x': x + 1}
+
+
+def synthetic_graph(num_actions):
+    """
+    Builds num_actions actions, arranged as independent chains of CHAIN_LENGTH actions:
+        x -> increment -> x -> increment -> x ...
+    """
+    eg = ExperimentGraph()
+    edges = []
+    for c in range((num_actions + CHAIN_LENGTH - 1) // CHAIN_LENGTH):
+        prev = LiteralLight(c, 'x')
+        eg.light_node(prev)
+        for _ in range(min(CHAIN_LENGTH, num_actions - c * CHAIN_LENGTH)):
+            action = ActionLight('increment', increment)
+            out = LiteralLight(None, 'x')
+            eg.light_node(action)
+            eg.light_node(out)
+            edges.append((prev, action))
+            edges.append((action, out))
+            prev = out
+    for u, v in edges:
+        eg.edge(u, v)
+    return eg
+
+
+def main(sizes):
+    print("{:>10} {:>12} {:>16}".format("actions", "seconds", "usec/action"))
+    for n in sizes:
+        eg = synthetic_graph(n)
+        start = time.perf_counter()
+        Executor.execute(eg)
+        elapsed = time.perf_counter() - start
+        print("{:>10} {:>12.4f} {:>16.2f}".format(n, elapsed, 1e6 * elapsed / n))
+
+
+if __name__ == '__main__':
+    main([int(i) for i in sys.argv[1:]] or [10, 1000, 100000])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Measures the save and load of experiment graphs in the format of GraphFile, against cloudpickle.
+Each trial of the synthetic graph binds a literal x, and runs:
+    (x, data) -> step -> y
+with Light Flor Objects in an ExperimentGraph, as Expander.expand_shared builds it.
+Reports the time to save, to load the whole graph, to load it without bindings and code, and to read the topology.
+The loaded graph of the smallest size is then compared to the saved one, executed, and its outputs checked.
+
+Usage: python benchmarks/graph_serialization.py [num_nodes ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import cloudpickle
+
+from flor.experiment_graph import ExperimentGraph, GraphFile, deserialize
+from flor.light_object_model import *
+from flor.engine.executor import Executor
+
+NODES_PER_TRIAL = 4
+
+
+def step(x, data, **kwargs):
+    return {'y': 2 * x}
+
+
+def graph(num_nodes):
+    eg = ExperimentGraph()
+    data = ArtifactLight('data.csv', 'data')
+    eg.light_node(data)
+    for i in range(num_nodes // NODES_PER_TRIAL):
+        x = LiteralLight(i, 'x')
+        action = ActionLight('step', step)
+        y = LiteralLight(None, 'y')
+        for node in (x, action, y):
+            eg.light_node(node)
+        for u, v in ((x, action), (data, action), (action, y)):
+            eg.edge(u, v)
+    return eg
+
+
+def timed(f):
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def main(sizes):
+    print("{:>10} {:>12} {:>12} {:>10} {:>12} {:>10} {:>10}".format(
+        "nodes", "pickle save", "pickle load", "save", "load", "structure", "topology"))
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, 'experiment_graph.flor')
+        for n in sizes:
+            eg = graph(n)
+            pickled = []
+            pickle_save = timed(lambda: pickled.append(cloudpickle.dumps(eg)))
+            pickle_load = timed(lambda: cloudpickle.loads(pickled[0]))
+            save = timed(lambda: eg.serialize(path))
+            load = timed(lambda: deserialize(path))
+            structure = timed(lambda: deserialize(path, bindings=False, code=False))
+            topology = timed(lambda: GraphFile(path).topology())
+            print("{:>10} {:>12.4f} {:>12.4f} {:>10.4f} {:>12.4f} {:>10.4f} {:>10.4f}".format(
+                len(eg.d), pickle_save, pickle_load, save, load, structure, topology))
+        check(min(sizes), path)
+
+
+def check(num_nodes, path):
+    """
+    Round trips the graph, which must keep its nodes, edges and maps, and produce y = 2 * x for every trial
+    """
+    eg = graph(num_nodes)
+    eg.serialize(path)
+    loaded = deserialize(path)
+
+    def shape(g):
+        nodes = [(type(v).__name__, getattr(v, 'name', None), getattr(v, 'v', None), v.max_depth,
+                  len(g.b[v]), len(g.d[v])) for v in g.d]
+        return (sorted(nodes, key=repr),
+                len(g.starts), len(g.name_map), {depth: len(actions) for depth, actions in g.actions_at_depth.items() if actions})
+
+    assert shape(loaded) == shape(eg), "The loaded graph differs from the saved one"
+    assert all(loaded.name_map["{}{}".format(v.name, id(v))] is v for v in loaded.d if type(v) != ActionLight)
+    Executor.execute(loaded, mode='thread')
+    ys = sorted(v.v for v in loaded.d if type(v) == LiteralLight and v.name == 'y')
+    expected = [2 * i for i in range(num_nodes // NODES_PER_TRIAL)]
+    assert ys == expected, "The loaded graph computed {} instead of {}".format(ys, expected)
+    print("round trip of {} nodes executed".format(len(loaded.d)))
+
+
+if __name__ == '__main__':
+    main([int(i) for i in sys.argv[1:]] or [1000, 10000, 100000])
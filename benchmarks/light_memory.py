@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Measures the memory of the expanded plate demo graph, per trial.
+The plate demo sweeps two literals, ones and tens, and runs:
+    ones -> double -> twice, tens -> triple -> thrice, (twice, thrice) -> multiply -> product
+The graph is built as Expander.expand_shared would: double and triple once per value, multiply once per trial.
+Reports the bytes allocated per trial by the Light Flor Objects and the graph, with tracemalloc.
+
+Usage: python benchmarks/light_memory.py [--compact] [num_trials ...]
+"""
+import math
+import sys
+import tracemalloc
+
+from flor.experiment_graph import ExperimentGraph, CompactExperimentGraph
+from flor.light_object_model import *
+
+
+def double(ones, **kwargs):
+    return {'twice': 2 * ones}
+
+
+def triple(tens, **kwargs):
+    return {'thrice': 3 * tens}
+
+
+def multiply(twice, thrice, **kwargs):
+    return {'product': twice * thrice}
+
+
+def plate_graph(num_trials, compact=False):
+    """
+    Builds the consolidated plate demo graph, with ones and tens sweeping about sqrt(num_trials) values each
+    """
+    num_ones = int(math.sqrt(num_trials))
+    num_tens = num_trials // num_ones
+    eg = CompactExperimentGraph() if compact else ExperimentGraph()
+
+    def sweep(name, values, func, output):
+        products = []
+        for v in values:
+            literal = LiteralLight(v, name)
+            action = ActionLight(func.__name__, func)
+            product = LiteralLight(None, output)
+            for node in (literal, action, product):
+                eg.light_node(node)
+            eg.edge(literal, action)
+            eg.edge(action, product)
+            products.append(product)
+        return products
+
+    twice = sweep('ones', range(1, num_ones + 1), double, 'twice')
+    thrice = sweep('tens', range(10, 10 * num_tens + 1, 10), triple, 'thrice')
+    for t in twice:
+        for h in thrice:
+            action = ActionLight('multiply', multiply)
+            product = LiteralLight(None, 'product')
+            eg.light_node(action)
+            eg.light_node(product)
+            eg.edge(t, action)
+            eg.edge(h, action)
+            eg.edge(action, product)
+    return eg, num_ones * num_tens
+
+
+def main(sizes, compact=False):
+    print("{:>10} {:>10} {:>14}".format("trials", "MB", "bytes/trial"))
+    for n in sizes:
+        tracemalloc.start()
+        eg, num_trials = plate_graph(n, compact)
+        # Reading the edges builds the adjacency of a compact graph
+        len(eg.d[next(iter(eg.d))])
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del eg
+        print("{:>10} {:>10.1f} {:>14.1f}".format(num_trials, allocated / 2 ** 20, allocated / num_trials))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    compact = '--compact' in args
+    args = [i for i in args if i != '--compact']
+    main([int(i) for i in args] or [10000, 100000, 1000000], compact)
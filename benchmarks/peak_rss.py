@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Measures the peak resident memory the Executor records for actions run in worker processes,
+    while the pulling process holds a large array.
+Forked workers start with the pages of their parent resident, which the actions do not use:
+    a no-op action should be recorded near 0MB, and an action allocating ALLOCATION MB near ALLOCATION,
+    whatever the size of the parent.
+
+Usage: python benchmarks/peak_rss.py [parent_mb]
+"""
+import sys
+
+from flor.experiment_graph import ExperimentGraph
+from flor.light_object_model import *
+from flor.engine.executor import Executor
+from flor.engine.history import History
+
+ALLOCATION = 100
+# Slack for the interpreter and the arguments of the call, in MB
+TOLERANCE = 25
+
+
+def noop(x, **kwargs):
+    return {'y': x}
+
+
+def allocate(x, **kwargs):
+    buffer = bytearray(ALLOCATION * 2 ** 20)
+    # Touch every page, so they are resident
+    buffer[::4096] = b'\1' * len(range(0, len(buffer), 4096))
+    return {'z': x}
+
+
+def graph():
+    eg = ExperimentGraph()
+    for i in range(4):
+        x = LiteralLight(i, 'x')
+        eg.light_node(x)
+        for name, func, out in (('noop', noop, 'y'), ('allocate', allocate, 'z')):
+            action = ActionLight(name, func)
+            product = LiteralLight(None, out)
+            eg.light_node(action)
+            eg.light_node(product)
+            eg.edge(x, action)
+            eg.edge(action, product)
+    return eg
+
+
+def main(parent_mb):
+    parent = bytearray(parent_mb * 2 ** 20)
+    parent[::4096] = b'\1' * len(range(0, len(parent), 4096))
+    history = History()
+    Executor.execute(graph(), parallelism=2, mode='process', history=history)
+    print("{:>10} {:>12} {:>14}".format("parent MB", "noop MB", "allocate MB"))
+    print("{:>10} {:>12.1f} {:>14.1f}".format(parent_mb, history.rss('noop'), history.rss('allocate')))
+    assert history.rss('noop') < TOLERANCE, "The peak of noop includes the memory of the parent"
+    assert abs(history.rss('allocate') - ALLOCATION) < TOLERANCE, "The peak of allocate is not its allocation"
+    del parent
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if sys.argv[1:] else 400)
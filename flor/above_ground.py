@@ -10,6 +10,7 @@ import flor.util as util
 from flor.stateful import State
 from flor.object_model import Artifact, Action, Literal
 from flor.experiment_graph import deserialize as eg_deserialize
+from flor.engine.object_store import ObjectStore, OBJECTS
 
 import os
 import subprocess
@@ -171,6 +172,8 @@ class CommitTracker(ContextTracker):
         self.__new_spec_nodev__()
 
         starts: Set[Union[Artifact, Literal]] = self.xp_state.eg.starts
+        checksums = util.checksums([node.loc for node in starts if type(node) == Artifact],
+                                   versioningDirectory=self.xp_state.versioningDirectory)
         for node in starts:
             if type(node) == Literal:
                 sourcekeyLit = self.sourcekeySpec + '.literal.' + node.name
@@ -223,7 +226,7 @@ class CommitTracker(ContextTracker):
                 artnodev = self.xp_state.gc.create_node_version(artnode.get_id(), tags={
                     'checksum': {
                         'key': 'checksum',
-                        'value': util.md5(node.loc),
+                        'value': checksums[node.loc],
                         'type': 'STRING'
                     }
                 })
@@ -294,7 +297,7 @@ class PullTracker(ContextTracker):
         # Lineage-Edge Link Trial to Elements in the Start set (black dashed-lines in whiteboard diagram)
         for i, trialnodev in enumerate(trial_node_versions):
             with util.chinto(os.path.join(self.versioning_directory, str(i))):
-                eg = eg_deserialize()
+                eg = eg_deserialize(code=False)
                 for start in eg.starts:
                     if type(start) == Literal:
                         # WRONG: Don't bind a trial version to every binding; only to ITS bindings!!
@@ -421,6 +424,8 @@ def commit(xp_state : State):
     }, parent_ids=latest_experiment_node_versions)
 
     starts: Set[Union[Artifact, Literal]] = xp_state.eg.starts
+    checksums = util.checksums([node.loc for node in starts if type(node) == Artifact],
+                               versioningDirectory=xp_state.versioningDirectory)
     for node in starts:
         if type(node) == Literal:
             sourcekeyLit = sourcekeySpec + '.literal.' + node.name
@@ -473,7 +478,7 @@ def commit(xp_state : State):
             artnodev = xp_state.gc.create_node_version(artnode.get_id(), tags={
                 'checksum': {
                     'key': 'checksum',
-                    'value': util.md5(node.loc),
+                    'value': checksums[node.loc],
                     'type': 'STRING'
                 }
             })
@@ -602,6 +607,8 @@ def peek(xp_state : State, loc):
 
     # Initialize sets
     starts: Set[Union[Artifact, Literal]] = xp_state.eg.starts
+    checksums = util.checksums([node.loc for node in starts if type(node) == Artifact],
+                               versioningDirectory=xp_state.versioningDirectory)
     ghosts = {}
     literalsOrder = []
 
@@ -667,7 +674,7 @@ def peek(xp_state : State, loc):
             artnodev = xp_state.gc.create_node_version(artnode.get_id(), tags={
                 'checksum': {
                     'key': 'checksum',
-                    'value': util.md5(node.loc),
+                    'value': checksums[node.loc],
                     'type': 'STRING'
                 }
             })
@@ -887,10 +894,10 @@ def fork(xp_state : State, inputCH):
     def geteg(xp_state, inputCH):
         original = os.getcwd()
         os.chdir(xp_state.versioningDirectory + '/' + xp_state.EXPERIMENT_NAME)
-        util.runProc('git checkout ' + inputCH)
-        with open('experiment_graph.pkl', 'rb') as f:
-            experimentg = dill.load(f)
-        util.runProc('git checkout master')
+        store = ObjectStore(os.path.join(xp_state.versioningDirectory, OBJECTS))
+        store.checkout(os.getcwd(), inputCH)
+        experimentg = eg_deserialize(code=False)
+        store.checkout(os.getcwd(), 'master')
         os.chdir(original)
         return experimentg
 
@@ -955,6 +962,8 @@ def fork(xp_state : State, inputCH):
     lineage = safeCreateLineage(sourcekeySpec, 'null')
     xp_state.gc.create_lineage_edge_version(lineage.get_id(), latest_experiment_nodev, forkedNodev)
     starts : Set[Union[Artifact, Literal]] = experimentg.starts
+    checksums = util.checksums([node.loc for node in starts if type(node) == Artifact],
+                               versioningDirectory=xp_state.versioningDirectory)
     for node in starts:
         if type(node) == Literal:
             sourcekeyLit = sourcekeySpec + '.literal.' + node.name
@@ -1004,7 +1013,7 @@ def fork(xp_state : State, inputCH):
             artnodev = xp_state.gc.create_node_version(artnode.get_id(), tags={
                 'checksum': {
                     'key': 'checksum',
-                    'value': util.md5(node.loc),
+                    'value': checksums[node.loc],
                     'type': 'STRING'
                 }
             })
@@ -1133,6 +1142,8 @@ def pull(xp_state : State, loc):
 
     #links everything to the dummy node
     starts : Set[Union[Artifact, Literal]] = xp_state.eg.starts
+    checksums = util.checksums([node.loc for node in starts if type(node) == Artifact],
+                               versioningDirectory=xp_state.versioningDirectory)
     ghosts = {}
     literalsOrder = []
     for node in starts:
@@ -1194,7 +1205,7 @@ def pull(xp_state : State, loc):
             artnodev = xp_state.gc.create_node_version(artnode.get_id(), tags={
                 'checksum': {
                     'key': 'checksum',
-                    'value': util.md5(node.loc),
+                    'value': checksums[node.loc],
                     'type': 'STRING'
                 }
             })
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compression of the pickles written by flor (artifacts and literals)
+Compressed files are standard gzip or xz files, so the codec of a file is detected from its magic number on read,
+    and other tools can read them. Files written with the 'auto' codec are only compressed
+    when they grow past THRESHOLD bytes, so small pickles are written as before.
+    Text artifacts are written uncompressed, for the tools that read them by extension (eg. pandas.read_csv).
+Gzip headers carry no timestamp nor file name, so the same content compresses to the same bytes,
+    and its copies are stored once (see ObjectStore).
+"""
+
+import gzip
+import io
+import lzma
+
+# Codecs, by name: (magic number, reader of a file, writer on a binary file object)
+CODECS = {
+    'gzip': (b'\x1f\x8b', lambda loc: gzip.open(loc, 'rb'),
+             lambda f, level: gzip.GzipFile(filename='', fileobj=f, mode='wb', compresslevel=level, mtime=0)),
+    'lzma': (b'\xfd7zXZ\x00', lambda loc: lzma.open(loc, 'rb'),
+             lambda f, level: lzma.LZMAFile(f, mode='wb', preset=level)),
+}
+
+# Codec and level of the 'auto' codec. Level 1 of gzip trades ratio for speed
+DEFAULT_CODEC = 'gzip'
+LEVELS = {'gzip': 1, 'lzma': 0}
+# Files written with the 'auto' codec are compressed once they reach this size
+THRESHOLD = 2 ** 20
+
+
+def detect(loc):
+    """
+    :return: The name of the codec of the file, or None if it is not compressed
+    """
+    with io.open(loc, 'rb') as f:
+        head = f.read(max(len(magic) for magic, _, _ in CODECS.values()))
+    for name, (magic, _, _) in CODECS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open(loc, mode='rb', codec='auto', level=None, encoding=None):
+    """
+    Opens an artifact file. The codec of a file opened for reading is detected
+    :param mode: 'rb', 'wb', 'r' or 'w'
+    :param codec: When writing, 'auto', 'none', 'gzip' or 'lzma'
+    :param level: Compression level of the codec, defaults to LEVELS
+    """
+    text = 'b' not in mode
+    if mode.replace('b', '').replace('t', '') not in ('r', 'w'):
+        raise ValueError("Unsupported mode '{}', expected 'rb', 'wb', 'r' or 'w'".format(mode))
+    if codec not in ('auto', 'none') and codec not in CODECS:
+        raise ValueError("Unknown codec '{}', expected one of {}".format(codec, ['auto', 'none'] + sorted(CODECS)))
+
+    if 'r' in mode:
+        codec = detect(loc)
+        if codec is None:
+            return io.open(loc, 'r' if text else 'rb', encoding=encoding)
+        f = CODECS[codec][1](loc)
+    elif codec == 'none':
+        return io.open(loc, 'w' if text else 'wb', encoding=encoding)
+    else:
+        f = io.BufferedWriter(__Writer__(loc, codec, level))
+    return io.TextIOWrapper(f, encoding=encoding) if text else f
+
+
+class __Writer__(io.RawIOBase):
+    """
+    Helper class for open
+    Writes through a codec. The 'auto' codec buffers the first THRESHOLD bytes, and writes them uncompressed
+        if the file ends there
+    """
+
+    def __init__(self, loc, codec, level):
+        self.file = io.open(loc, 'wb')
+        self.codec = DEFAULT_CODEC if codec == 'auto' else codec
+        self.level = LEVELS[self.codec] if level is None else level
+        self.buffer = bytearray() if codec == 'auto' else None
+        self.stream = None if codec == 'auto' else CODECS[self.codec][2](self.file, self.level)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.stream is None:
+            self.buffer += b
+            if len(self.buffer) >= THRESHOLD:
+                self.stream = CODECS[self.codec][2](self.file, self.level)
+                self.stream.write(self.buffer)
+                self.buffer = None
+        else:
+            self.stream.write(b)
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.stream is not None:
+                self.stream.close()
+            elif self.buffer:
+                self.file.write(self.buffer)
+        finally:
+            self.file.close()
+            super().close()
+
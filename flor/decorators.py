@@ -2,16 +2,32 @@
 
 import inspect
 
+from flor import serializers
 from flor import util
 from flor import global_state
 from sklearn.externals import joblib
 
 
-def func(foo):
+def func(foo=None, mode=None, cores=None, rss=None):
     """
     Function decorator
+    Use as @func, or as @func(mode=..., cores=..., rss=...) to set options
+    Coroutine functions (async def) are supported, and run concurrently on one event loop in async pulls
     :param foo: Function
+    :param mode: 'process' or 'thread', the kind of worker that runs the function in parallel pulls
+        Defaults to the mode of the pull. Prefer 'thread' for I/O-bound or GIL-releasing functions
+    :param cores: Number of cores the function keeps busy, counted against the cores of the pull.
+        If not set, the function is only limited by the number of workers of the pull
+    :param rss: Peak resident memory of the function, in MB. Defaults to the peak measured in previous pulls
     """
+    if foo is None:
+        return lambda f: func(f, mode, cores, rss)
+
+    if mode not in (None, 'process', 'thread'):
+        raise ValueError("Unknown execution mode '{}', expected 'process' or 'thread'".format(mode))
+    foo.__florOptions__ = {'mode': mode, 'coroutine': inspect.iscoroutinefunction(foo),
+                           'cores': cores, 'rss': rss}
+
     if global_state.interactive:
         if global_state.nb_name is None:
             raise ValueError("Please call flor.setNotebookName")
@@ -51,16 +67,13 @@ def deprecated_func(lambdah):
             for in_art in [in_art.loc if util.isFlorClass(in_art) else in_art for in_art in in_artifacts]:
                 if util.isPickle(in_art):
                     try:
-                        x = util.unpickle(in_art)
+                        x = serializers.load(in_art)
                     except:
                         x = joblib.load(in_art)
                 elif util.isCsv(in_art):
                     x = in_art
                 elif util.isLoc(in_art):
-                    with open(in_art, 'r') as f:
-                        x = [i.strip() for i in f.readlines() if i.strip()]
-                    if len(x) == 1:
-                        x = x[0]
+                    x = serializers.load(in_art)
                 else:
                     x = in_art
                 in_args.append(x)
@@ -73,40 +86,19 @@ def deprecated_func(lambdah):
                 for out, out_loc in zip(outs, [out_art.loc for out_art in out_artifacts]):
                     if util.isPickle(out_loc):
                         try:
-                            util.pickleTo(out, out_loc)
+                            serializers.dump(out, out_loc)
                         except:
                             joblib.dump(out, out_loc)
                     else:
-                        with open(out_loc, 'w') as f:
-                            if util.isIterable(out):
-                                for o in out:
-                                    f.write(str(o) + '\n')
-                            else:
-                                f.write(str(out) + '\n')
+                        serializers.dump(out, out_loc)
             except:
                 assert len(out_artifacts) == 1
                 outs = [outs, ]
                 for out, out_loc in zip(outs, [out_art.loc for out_art in out_artifacts]):
-                    if util.isPickle(out_loc):
-                        util.pickleTo(out, out_loc)
-                    else:
-                        with open(out_loc, 'w') as f:
-                            if util.isIterable(out):
-                                for o in out:
-                                    f.write(str(o) + '\n')
-                            else:
-                                f.write(str(out) + '\n')
+                    serializers.dump(out, out_loc)
         elif out_artifacts and outs is not None:
             out_loc = out_artifacts[0].loc
-            if util.isPickle(out_loc):
-                util.pickleTo(outs, out_loc)
-            else:
-                with open(out_loc, 'w') as f:
-                    if util.isIterable(outs):
-                        for o in outs:
-                            f.write(str(o) + '\n')
-                    else:
-                        f.write(str(outs) + '\n')
+            serializers.dump(outs, out_loc)
         else:
             raise AssertionError("Missing location to write or Missing return value.")
         return lambdah.__name__
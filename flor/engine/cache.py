@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import shutil
+import tempfile
+
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from flor import serializers
+
+# Default bound on the size of the cache
+MAX_BYTES = 2 ** 30
+
+# Out of band, so the large buffers of the literals are mapped back (see serializers.PickleSerializer)
+LITERALS = 'literals.florpkl'
+ARTIFACTS = 'artifacts'
+
+
+class Cache:
+    """
+    Persistent, content-addressed cache of action results
+    An entry is keyed by the fingerprint of the action (see Fingerprinter),
+        and holds the output literals and a copy of the output artifacts.
+    When the cache grows past max_bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        """
+        :param path: Directory of the cache, created on first write
+        :param max_bytes: Bound on the total size of the entries
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        # Maps each key to the size of its entry, least recently used first. Loaded on first use
+        self.entries: OrderedDict = None
+        self.num_bytes = 0
+
+    def __load__(self):
+        if self.entries is not None:
+            return
+        self.entries = OrderedDict()
+        if not os.path.isdir(self.path):
+            return
+        found = []
+        for key in os.listdir(self.path):
+            entry = os.path.join(self.path, key)
+            if os.path.isdir(entry) and not key.startswith('.'):
+                found.append((os.stat(entry).st_mtime, key, Cache.__size__(entry)))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.num_bytes += size
+
+    @staticmethod
+    def __size__(directory):
+        size = 0
+        for root, _, files in os.walk(directory):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+        return size
+
+    def get(self, key) -> Optional[Dict[str, object]]:
+        """
+        :return: The output literals of the entry, by name, or None on a miss.
+            Output artifacts are read with artifact_path
+        """
+        self.__load__()
+        if key not in self.entries:
+            return None
+        entry = os.path.join(self.path, key)
+        try:
+            literals = serializers.load(os.path.join(entry, LITERALS))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # A torn entry, or one of an earlier format, is dropped so put stores the outputs again
+            self.num_bytes -= self.entries.pop(key)
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        self.entries.move_to_end(key)
+        os.utime(entry)
+        return literals
+
+    def artifact_path(self, key, name):
+        return os.path.join(self.path, key, ARTIFACTS, name)
+
+    def put(self, key, literals: Dict[str, object], artifacts: Dict[str, str]):
+        """
+        Stores the outputs of an action, then evicts least recently used entries until the cache fits
+        Outputs that cannot be pickled are not cached
+        :param literals: Maps the name of each output literal to its value
+        :param artifacts: Maps the name of each output artifact to the file the action wrote
+        """
+        self.__load__()
+        if key in self.entries:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.path, prefix='.')
+        try:
+            serializers.dump(literals, os.path.join(staging, LITERALS))
+            os.mkdir(os.path.join(staging, ARTIFACTS))
+            for name in artifacts:
+                if not os.path.isfile(artifacts[name]):
+                    # The action did not write its artifact, do not remember the result
+                    shutil.rmtree(staging)
+                    return
+                shutil.copyfile(artifacts[name], os.path.join(staging, ARTIFACTS, name))
+            os.rename(staging, os.path.join(self.path, key))
+        except (pickle.PicklingError, TypeError, AttributeError, OSError):
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        size = Cache.__size__(os.path.join(self.path, key))
+        self.entries[key] = size
+        self.num_bytes += size
+
+        while self.num_bytes > self.max_bytes and len(self.entries) > 1:
+            evicted, size = self.entries.popitem(last=False)
+            shutil.rmtree(os.path.join(self.path, evicted), ignore_errors=True)
+            self.num_bytes -= size
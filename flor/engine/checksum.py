@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import hashlib
+import mmap
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
+
+from flor.engine.stat_cache import StatCache
+
+# Files at least this large are hashed through mmap, smaller ones with buffered reads
+MMAP_SIZE = 2 ** 24
+BUFFER_SIZE = 2 ** 20
+# Size of the slices of a mapped file given to the hash, so it releases the GIL between them
+SLICE_SIZE = 2 ** 22
+
+ALGORITHMS = {
+    'md5': hashlib.md5,
+    'blake2b': lambda: hashlib.blake2b(digest_size=16),
+}
+
+
+class Checksummer:
+    """
+    Checksums of artifact files, cached by the stat of the file (see StatCache) and persisted across runs
+    Files that were not checksummed since they last changed are hashed concurrently on a thread pool:
+        hashlib releases the GIL, so the reads and hashes of large files overlap.
+    """
+
+    # One shared service per cache file
+    __services__ = {}
+    __services_lock__ = threading.Lock()
+
+    def __init__(self, path=None, algorithm='md5', max_workers=None):
+        """
+        :param path: JSON file backing the cache. If None, the cache lives in memory only
+        :param algorithm: 'md5', or 'blake2b' which is faster on 64-bit machines
+        :param max_workers: Number of threads hashing files. Defaults to the number of CPUs
+        """
+        if algorithm not in ALGORITHMS:
+            raise ValueError("Unknown checksum algorithm '{}', expected one of {}".format(
+                algorithm, sorted(ALGORITHMS)))
+        self.algorithm = algorithm
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = StatCache(path)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def service(versioningDirectory, algorithm='md5') -> 'Checksummer':
+        """
+        :return: The checksum service of the versioning directory, created on first use
+        """
+        path = os.path.join(versioningDirectory, '.checksums', algorithm + '.json')
+        with Checksummer.__services_lock__:
+            if path not in Checksummer.__services__:
+                Checksummer.__services__[path] = Checksummer(path, algorithm)
+            return Checksummer.__services__[path]
+
+    def hash(self, path) -> str:
+        """
+        Hashes the file, without the cache
+        """
+        h = ALGORITHMS[self.algorithm]()
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    view = memoryview(m)
+                    try:
+                        for offset in range(0, size, SLICE_SIZE):
+                            h.update(view[offset:offset + SLICE_SIZE])
+                    finally:
+                        view.release()
+            else:
+                buffer = bytearray(BUFFER_SIZE)
+                view = memoryview(buffer)
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    h.update(view[:n])
+        return h.hexdigest()
+
+    def checksum(self, path) -> str:
+        return self.checksums([path, ])[path]
+
+    def checksums(self, paths: Iterable[str]) -> Dict[str, str]:
+        """
+        :return: Dictionary mapping each path to the checksum of its file
+        """
+        result = {}
+        stats = {}
+        for path in paths:
+            if path in result or path in stats:
+                continue
+            st = os.stat(path)
+            with self.lock:
+                checksum = self.cache.get(path, st)
+            if checksum is None:
+                stats[path] = st
+            else:
+                result[path] = checksum
+
+        if stats:
+            if len(stats) == 1 or self.max_workers == 1:
+                checksums = map(self.hash, stats)
+            else:
+                with ThreadPoolExecutor(min(self.max_workers, len(stats))) as pool:
+                    checksums = list(pool.map(self.hash, stats))
+            with self.lock:
+                for path, checksum in zip(stats, checksums):
+                    self.cache.put(path, checksum, stats[path])
+                    result[path] = checksum
+                self.cache.save()
+        return result
@@ -1,43 +1,171 @@
 #!/usr/bin/env python3
 
 from flor.experiment_graph import ExperimentGraph
-from typing import List
+from flor.light_object_model import *
+from flor.engine.tracer import Tracer
+from typing import Dict, Iterable, List, Tuple
+
+from concurrent.futures import ProcessPoolExecutor
+
+import gc
+import os
+import pickle
+import threading
+
+# Number of trial graphs each leaf of the reduction tree consolidates
+CHUNK_SIZE = 4096
 
 
 class Consolidator:
     """
     See consolidate
+    Consolidates the trial graphs of the pulls that do not expand into the shared graph, see Literal.pull
     """
 
     @staticmethod
-    def consolidate(experiment_graphs: List[ExperimentGraph]) -> ExperimentGraph:
+    def consolidate(experiment_graphs: Iterable[ExperimentGraph], parallelism: int = 1,
+                    chunk_size: int = CHUNK_SIZE, tracer: Tracer = None) -> ExperimentGraph:
         """
-        Takes a list of independent experiment graphs and consolidates them into a single
+        Takes independent experiment graphs and consolidates them into a single
         graph (in place). The consolidation removes redundancies and enables artifact sharing
         respecting the dependencies and identity semantics (see wiki).
-        :param experiment_graphs: List of experiment graph, output of source experiment graph expansion
+        The graphs are consumed one at a time, so they may be streamed from the Expander
+        :param experiment_graphs: Iterable of experiment graph, output of source experiment graph expansion
+        :param parallelism: If greater than 1, the number of worker processes that consolidate the graphs
+            as a balanced tree: chunks of graphs are consolidated in parallel, then merged pairwise
+        :param chunk_size: Number of graphs in each chunk, the leaves of the tree
+        :param tracer: Records each Aligner.put as a 'consolidate' span, or the merges of the tree, see Tracer
         :return: One consolidated experiment graph with "Light" versions of the object model
         """
-        assert len(experiment_graphs) > 0, "Failed: Expansion of Experiment Graphs"
-        if len(experiment_graphs) == 1:
-            # No "lifting", return the only experiment graph
-            return experiment_graphs.pop()
+        if parallelism > 1:
+            return Consolidator.__consolidate_tree__(experiment_graphs, parallelism, chunk_size, tracer)
+
+        experiment_graphs = iter(experiment_graphs)
+        seed_eg = next(experiment_graphs, None)
+        assert seed_eg is not None, "Failed: Expansion of Experiment Graphs"
 
-        aligner = Aligner(experiment_graphs[0])
+        # With a single graph there is no "lifting", the seed is returned as is
+        aligner = Aligner(seed_eg)
 
-        for eg in experiment_graphs[1:]:
-            aligner.put(eg)
+        for i, eg in enumerate(experiment_graphs, 1):
+            with Tracer.optional(tracer, 'consolidate', args={'trial': i, 'step': 'Aligner.put'}):
+                aligner.put(eg)
 
         return aligner.eg
 
+    @staticmethod
+    def __merge__(pickled: List[bytes]) -> Tuple[bytes, Dict]:
+        """
+        Runs in a worker process
+        Consolidates the experiment graphs, each pickled alone or in a list
+        :return: The pickled consolidated graph, and the span of the merge
+        """
+        start = Tracer.now()
+        # The graphs are only allocated here, never freed, so cyclic garbage collection would only rescan them
+        gc.disable()
+        try:
+            experiment_graphs = []
+            for each in pickled:
+                each = pickle.loads(each)
+                if type(each) == list:
+                    experiment_graphs.extend(each)
+                else:
+                    experiment_graphs.append(each)
+            consolidated_graph = pickle.dumps(Consolidator.consolidate(experiment_graphs), pickle.HIGHEST_PROTOCOL)
+            return consolidated_graph, {'start': start, 'end': Tracer.now(), 'pid': os.getpid(),
+                                        'tid': threading.get_native_id(), 'graphs': len(experiment_graphs)}
+        finally:
+            gc.enable()
+
+    @staticmethod
+    def __consolidate_tree__(experiment_graphs: Iterable[ExperimentGraph], parallelism: int,
+                             chunk_size: int, tracer: Tracer = None) -> ExperimentGraph:
+        """
+        See consolidate
+        The leaves are submitted as soon as their chunk is drawn from experiment_graphs,
+            then every level merges adjacent pairs, so the seed of each merge is always the earlier trials
+        Consolidation does not call the functions of the actions, so they stay in this process:
+            the graphs are shipped with each function replaced by its id, and restored at the end.
+        """
+        funcs = {}
+
+        def result(future) -> bytes:
+            pickled, span = future.result()
+            if tracer is not None:
+                tracer.complete('merge', 'consolidate', span['start'], span['end'], span['pid'], span['tid'],
+                                args={'graphs': span['graphs']})
+            return pickled
+
+        def ship(chunk):
+            for eg in chunk:
+                for node in eg.d:
+                    if type(node) == ActionLight:
+                        funcs[id(node.func)] = node.func
+                        node.func = id(node.func)
+            return pool.submit(Consolidator.__merge__, [pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL)])
+
+        with ProcessPoolExecutor(max_workers=parallelism) as pool:
+            level = []
+            chunk = []
+            for eg in experiment_graphs:
+                chunk.append(eg)
+                if len(chunk) == chunk_size:
+                    level.append(ship(chunk))
+                    chunk = []
+            if chunk:
+                level.append(ship(chunk))
+            assert len(level) > 0, "Failed: Expansion of Experiment Graphs"
+
+            # The leaves were merging as the graphs were expanded, this waits on the rest of the tree
+            with Tracer.optional(tracer, 'consolidate', args={'chunks': len(level)}):
+                while len(level) > 1:
+                    merged = []
+                    for i in range(0, len(level) - 1, 2):
+                        merged.append(pool.submit(Consolidator.__merge__, [result(level[i]), result(level[i + 1])]))
+                    if len(level) % 2 == 1:
+                        merged.append(level[-1])
+                    level = merged
+
+                consolidated_graph = pickle.loads(result(level[0]))
+
+        for node in consolidated_graph.d:
+            if type(node) == ActionLight:
+                node.func = funcs[node.func]
+        return consolidated_graph
+
 
 class Aligner:
     """
     Helper class for Consolidator
+    Nodes are matched by signature (see __signature__), so that consolidating a graph is a dictionary lookup per node
     """
 
     def __init__(self, seed_eg: ExperimentGraph):
         self.eg = seed_eg
+        # Maps the signature of each start of self.eg to the start
+        self.starts = {}
+        # Maps the signature of each action of self.eg to the action
+        self.actions = {}
+
+        for start in self.eg.starts:
+            self.starts.setdefault(self.__signature__(start), start)
+        for depth in sorted(self.eg.actions_at_depth):
+            for action in self.eg.actions_at_depth[depth]:
+                self.actions.setdefault(self.__signature__(action), action)
+
+    def __signature__(self, node):
+        """
+        Canonical structural signature of node in self.eg: equal nodes have equal signatures
+        The signature of a resource is its own (see signature in light_object_model)
+        The signature of an action is its funcName, its inputs and the signatures of its outputs.
+            Its inputs are already consolidated, so each input is the one node with its signature,
+            and the identity of the input stands for its signature.
+        """
+        if type(node) == ActionLight:
+            return (node.funcName,
+                    frozenset(self.eg.b[node]),
+                    frozenset(product.signature() for product in self.eg.d[node]))
+        return node.signature()
 
     def put(self, other_eg: ExperimentGraph):
         """
@@ -49,12 +177,13 @@ class Aligner:
 
         self.__consolidate_starts__(other_eg.starts)
 
-        depths = [i for i in self.eg.actions_at_depth.keys()]
-        depths.sort()
-        for depth in depths:
+        for depth in sorted(other_eg.actions_at_depth):
             new_actions = self.__consolidate_actions_at_depth__(other_eg, depth)
             # Add the actions that are not collapsible (because they are distinct)
+            self.eg.actions_at_depth.setdefault(depth, set([]))
             self.eg.actions_at_depth[depth] |= new_actions
+        # d and b were rewired in place
+        self.eg.invalidate()
 
     def __consolidate_starts__(self, other_eg_starts):
         """
@@ -66,24 +195,25 @@ class Aligner:
         Pointers from actual relevants are set (back and forth)
         :param other_eg_starts: The starts set of other experiment graph
         """
-        # Before the change, take a copy for iteration purposes
-        true_start = self.eg.starts.copy()
         self.eg.starts |= other_eg_starts
 
-        for seed_start in true_start:
-            for other_start in other_eg_starts:
-                if seed_start.equals(other_start):
-                    # Remove the redundant start
-                    self.eg.starts -= {other_start, }
-                    for consuming_action in self.eg.d[other_start]:
-                        # Consuming action no longer has backward edge to redundant start
-                        self.eg.b[consuming_action] -= {other_start, }
-                        # Now connect new to seed
-                        # The relevant (non-redundant) start now has an edge to
-                        #   The action that would have consumed the redundant start
-                        self.eg.d[seed_start] |= {consuming_action, }
-                        self.eg.b[consuming_action] |= {seed_start, }
-                    del self.eg.d[other_start]
+        for other_start in other_eg_starts:
+            signature = self.__signature__(other_start)
+            seed_start = self.starts.get(signature)
+            if seed_start is None:
+                self.starts[signature] = other_start
+                continue
+            # Remove the redundant start
+            self.eg.starts -= {other_start, }
+            for consuming_action in self.eg.d[other_start]:
+                # Consuming action no longer has backward edge to redundant start
+                self.eg.b[consuming_action] -= {other_start, }
+                # Now connect new to seed
+                # The relevant (non-redundant) start now has an edge to
+                #   The action that would have consumed the redundant start
+                self.eg.d[seed_start] |= {consuming_action, }
+                self.eg.b[consuming_action] |= {seed_start, }
+            del self.eg.d[other_start]
 
     def __consolidate_actions_at_depth__(self, other_eg: ExperimentGraph, depth: int):
         """
@@ -99,39 +229,19 @@ class Aligner:
         # New actions are actions that do not consolidate because they have no equivalent action in self.eg
         new_actions = set([])
         for other_action in other_eg.actions_at_depth[depth]:
-            no_match = True
-            for seed_action in self.eg.actions_at_depth[depth]:
-                if (seed_action.equals(other_action)
-                        and self.eg.b[seed_action] == self.eg.b[other_action]
-                        and self.__has_same_outputs__(seed_action, other_action)):
-                    # Have established seed_action and other_action are identical
-                    # begin collapse
-                    self.__collapse_actions__(seed_action, other_action)
-                    no_match = False
-                    break
-            if no_match:
+            signature = self.__signature__(other_action)
+            seed_action = self.actions.get(signature)
+            if seed_action is not None:
+                # Have established seed_action and other_action are identical
+                # begin collapse
+                self.__collapse_actions__(seed_action, other_action)
+            else:
                 assert other_action in self.eg.d
                 assert other_action in self.eg.b
+                self.actions[signature] = other_action
                 new_actions |= {other_action, }
         return new_actions
 
-    def __has_same_outputs__(self, seed_action, other_action) -> bool:
-        """
-        Helper Method
-        Checks whether the seed action and other action have the same output resources (ArtifactLight/LiteralLight)
-        :param seed_action: an action from the source experiment graph
-        :param other_action: an action from other experiment graph
-        :return: Whether both actions have the same outputs
-        """
-        # In English:
-        #     For all outputs in seed_action
-        #        There is some output in other_action that is equal
-        expressions = []
-        for seed_action_product in self.eg.d[seed_action]:
-            exp = any(map(lambda x: x.equals(seed_action_product), self.eg.d[other_action]))
-            expressions.append(exp)
-        return all(expressions)
-
     def __collapse_actions__(self, seed_action, other_action):
         """
         Helper Method
@@ -146,25 +256,22 @@ class Aligner:
             self.eg.d[input_resource] -= {other_action, }
 
         # For every action consuming an artifact other_action produces, fix the pointers
-        for seed_action_product in self.eg.d[seed_action]:
-            for other_action_product in self.eg.d[other_action]:
-                if seed_action_product.equals(other_action_product):
-                    for down_consuming_other_action in self.eg.d[other_action_product]:
-                        self.eg.b[down_consuming_other_action] -= {other_action_product, }
-                        self.eg.b[down_consuming_other_action] |= {seed_action_product, }
-                        self.eg.d[seed_action_product] |= {down_consuming_other_action, }
-                    for up_producing_other_action in self.eg.b[other_action_product]:
-                        if up_producing_other_action != other_action:
-                            self.eg.b[seed_action_product] |= {up_producing_other_action, }
-                            self.eg.d[up_producing_other_action] -= {other_action_product, }
-                            self.eg.d[up_producing_other_action] |= {seed_action_product, }
-                    # Clean up
-                    if other_action_product not in self.eg.pre_absorb_d:
-                        del self.eg.d[other_action_product]
-                    if other_action_product not in self.eg.pre_absorb_b:
-                        del self.eg.b[other_action_product]
+        seed_products = {product.signature(): product for product in self.eg.d[seed_action]}
+        for other_action_product in self.eg.d[other_action]:
+            seed_action_product = seed_products.get(other_action_product.signature())
+            if seed_action_product is not None:
+                for down_consuming_other_action in self.eg.d[other_action_product]:
+                    self.eg.b[down_consuming_other_action] -= {other_action_product, }
+                    self.eg.b[down_consuming_other_action] |= {seed_action_product, }
+                    self.eg.d[seed_action_product] |= {down_consuming_other_action, }
+                for up_producing_other_action in self.eg.b[other_action_product]:
+                    if up_producing_other_action != other_action:
+                        self.eg.b[seed_action_product] |= {up_producing_other_action, }
+                        self.eg.d[up_producing_other_action] -= {other_action_product, }
+                        self.eg.d[up_producing_other_action] |= {seed_action_product, }
+                # Clean up, the nodes of other_eg were absorbed into self.eg
+                del self.eg.d[other_action_product]
+                del self.eg.b[other_action_product]
         # Clean up
-        if other_action not in self.eg.pre_absorb_d:
-            del self.eg.d[other_action]
-        if other_action not in self.eg.pre_absorb_b:
-            del self.eg.b[other_action]
+        del self.eg.d[other_action]
+        del self.eg.b[other_action]
@@ -2,18 +2,38 @@
 
 from flor.experiment_graph import ExperimentGraph
 from flor.light_object_model import *
-from typing import List
-
-import time
-import os.path
-
-EPOCH = 0.01
+from flor.engine.cache import Cache
+from flor.engine.fingerprint import Fingerprinter
+from flor.engine.history import History
+from flor.engine.journal import Journal
+from flor.engine.tracer import Tracer
+from typing import Dict, Optional
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import asyncio
+import heapq
+import inspect
+import os
+import resource
+import shutil
+import sys
+import threading
+import cloudpickle as dill
+
+MODES = ('process', 'thread', 'async')
 
 
 class Executor:
 
+    # Functions already unpickled by this (worker) process, keyed by their pickled bytes
+    __worker_funcs__ = {}
+
     @staticmethod
-    def __run__(eg: ExperimentGraph, action: ActionLight):
+    def __bind__(eg: ExperimentGraph, action: ActionLight):
+        """
+        Computes the keyword arguments of the action's function
+        :return: kwargs, a dictionary mapping the name of each output literal to the id of its LiteralLight
+        """
         inputs = eg.b[action]
         outputs = eg.d[action]
         output_ids = {}
@@ -33,107 +53,486 @@ class Executor:
             else:
                 output_ids[o.name] = id(o)
 
-        response = action.func(**kwargs)
+        return kwargs, output_ids
 
+    @staticmethod
+    def __store__(eg: ExperimentGraph, response, output_ids):
         for kee in response:
             eg.update_value(kee, output_ids[kee], response[kee])
 
     @staticmethod
-    def __isolate_location__(id_num, location):
-        # Currently only supports localhost, singlenode
-        location_array = location.split('.')
-        return "{}_{}.{}".format('.'.join(location_array[0:-1]), id_num, location_array[-1])
+    def __invoke__(func, kwargs):
+        """
+        Calls func, running it to completion on a private event loop if it is a coroutine function
+        :return: The response of func, and a dictionary of measurements
+        """
+        start = Tracer.now()
+        response = func(**kwargs)
+        if inspect.iscoroutine(response):
+            response = Executor.__run_coroutine__(response)
+        return response, Executor.__measure__(start)
 
     @staticmethod
-    def __is_finished__(eg: ExperimentGraph, action: ActionLight):
-        outputs = eg.d[action]
+    async def __invoke_async__(func, kwargs):
+        start = Tracer.now()
+        response = await func(**kwargs)
+        return response, Executor.__measure__(start)
 
-        def helper(x):
-            if type(x) == LiteralLight:
-                return x.v is not None
-            elif type(x) == ArtifactLight:
-                return os.path.exists(x.loc)
+    @staticmethod
+    def __measure__(start):
+        end = Tracer.now()
+        return {'runtime': (end - start) / 1e9, 'start': start, 'end': end,
+                'pid': os.getpid(), 'tid': threading.get_native_id()}
 
-        return all(map(helper, outputs))
+    @staticmethod
+    def __run_coroutine__(coroutine):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+        # This thread already runs an event loop (e.g. Jupyter), so use another thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, coroutine).result()
 
     @staticmethod
-    def __is_ready__(eg: ExperimentGraph, action: ActionLight):
-        producing_actions = Executor.__get_producing_actions__(eg, action)
-        return all(map(lambda x: not x.pending, producing_actions))
+    def __work__(pickled_func: bytes, kwargs):
+        """
+        Runs in a worker process
+        Functions are shipped with cloudpickle, so closures and functions defined in __main__ work too
+        Besides the runtime, measures the peak resident memory of the call
+        """
+        if pickled_func not in Executor.__worker_funcs__:
+            Executor.__worker_funcs__[pickled_func] = dill.loads(pickled_func)
+        baseline = Executor.__reset_peak_rss__()
+        response, measurements = Executor.__invoke__(Executor.__worker_funcs__[pickled_func], kwargs)
+        measurements['rss'] = Executor.__peak_rss__(baseline)
+        return response, measurements
 
     @staticmethod
-    def __get_consuming_actions__(eg: ExperimentGraph, action: ActionLight):
-        outputs = eg.d[action]
-        consuming_actions = set([])
+    def __status__(field) -> Optional[float]:
+        """
+        :return: The field of /proc/self/status (eg. VmRSS), in MB, or None where there is no /proc
+        """
+        try:
+            with open('/proc/self/status', 'r') as f:
+                for line in f:
+                    if line.startswith(field + ':'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
 
-        for o in outputs:
-            consuming_actions |= eg.d[o]
+    @staticmethod
+    def __max_rss__() -> float:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
 
-        return consuming_actions
+    @staticmethod
+    def __reset_peak_rss__() -> float:
+        """
+        Resets the peak resident memory of this process to its current resident memory (Linux only)
+        :return: The resident memory the peak is measured from, in MB. A forked worker starts with the pages
+            it shares with its parent resident, which the action did not use
+        """
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            # The peak covers the whole life of the worker so far
+            return Executor.__max_rss__()
+        rss = Executor.__status__('VmRSS')
+        return rss if rss is not None else Executor.__max_rss__()
 
     @staticmethod
-    def __get_producing_actions__(eg: ExperimentGraph, action: ActionLight):
-        inputs = eg.b[action]
-        producing_actions = set([])
+    def __peak_rss__(baseline: float = 0) -> float:
+        """
+        :param baseline: The resident memory returned by __reset_peak_rss__
+        :return: Peak resident memory of this process in MB, since the last __reset_peak_rss__, above baseline
+        """
+        peak = Executor.__status__('VmHWM')
+        if peak is None:
+            peak = Executor.__max_rss__()
+        return max(peak - baseline, 0)
 
-        for i in inputs:
-            producing_actions |= eg.b[i]
-
-        return producing_actions
-
-    @staticmethod
-    def __no_child_is_pending__(eg: ExperimentGraph, action: ActionLight):
-        consuming_actions = Executor.__get_consuming_actions__(eg, action)
-        return all(map(lambda x: not x.pending, consuming_actions))
-
-    @staticmethod
-    def execute(eg: ExperimentGraph):
-        # Initialize empty lists
-        ready: List[ActionLight] = []
-        running: List[ActionLight] = []
-        done: List[ActionLight] = []
-        explored: List[ActionLight] = []
-
-        for root in eg.actions_at_depth[1]:
-            ready.append(root)
-
-        new_done = False
-
-        while True:
-            for each in range(len(ready)):
-                action = ready.pop(0)
-                Executor.__run__(eg, action)
-                running.append(action)
-            time.sleep(EPOCH)
-            # TODO: Make for-loop concurrent
-            for each in range(len(running)):
-                action = running.pop(0)
-                if Executor.__is_finished__(eg, action):
-                    action.pending = False
-                    done.append(action)
-                    new_done = True
-                else:
-                    running.append(action)
-            if eg.is_none_pending():
-                break
-            if new_done:
-                examined: List[ActionLight] = []
-                for each in range(len(done)):
-                    d = done.pop(0)
-                    if Executor.__no_child_is_pending__(eg, d):
-                        explored.append(d)
-                    else:
-                        done.append(d)
-                        for child in Executor.__get_consuming_actions__(eg, d):
-                            if child.pending:
-                                if child not in examined:
-                                    if Executor.__is_ready__(eg, child):
-                                        ready.append(child)
-                                    examined.append(child)
-                new_done = False
+    @staticmethod
+    def __submit__(pools, pickled_funcs, action: ActionLight, mode: str, kwargs, parallelism: int) -> Future:
+        """
+        Submits the action to the pool of its mode, creating the pool on first use
+        :param pools: Dictionary mapping mode to its pool
+        :param pickled_funcs: Dictionary mapping the id of a function to its cloudpickled bytes
+        """
+        if mode not in pools:
+            if mode == 'process':
+                pools[mode] = ProcessPoolExecutor(max_workers=parallelism)
+            else:
+                pools[mode] = ThreadPoolExecutor(max_workers=parallelism)
+        if mode == 'process':
+            if id(action.func) not in pickled_funcs:
+                pickled_funcs[id(action.func)] = dill.dumps(action.func)
+            return pools[mode].submit(Executor.__work__, pickled_funcs[id(action.func)], kwargs)
+        return pools[mode].submit(Executor.__invoke__, action.func, kwargs)
+
+    @staticmethod
+    def __isolate_location__(id_num, location):
+        # Currently only supports localhost, singlenode
+        location_array = location.split('.')
+        return "{}_{}.{}".format('.'.join(location_array[0:-1]), id_num, location_array[-1])
+
+    @staticmethod
+    def __get_consuming_actions__(eg: ExperimentGraph, action: ActionLight):
+        # Indexed by the graph, see GraphIndex
+        return eg.consuming_actions(action)
+
+    @staticmethod
+    def __get_producing_actions__(eg: ExperimentGraph, action: ActionLight):
+        return eg.producing_actions(action)
 
+    @staticmethod
+    def __prepare__(eg: ExperimentGraph, scheduler: "Scheduler", stores: "Stores", action: ActionLight):
+        """
+        Binds the arguments of the action. If a store (journal or cache) holds the outputs of the action,
+            restores them and completes the action
+        :return: kwargs, output_ids (see __bind__) and the fingerprint of the action,
+            or None if the action was restored
+        """
+        start = Tracer.now()
+        kwargs, output_ids = Executor.__bind__(eg, action)
+        key = None
+        if stores:
+            key = stores.fingerprinter.fingerprint(action, eg.b[action], eg.d[action], kwargs)
+            if key is not None:
+                for store in stores:
+                    literals = store.get(key)
+                    if literals is not None:
+                        for o in eg.d[action]:
+                            if type(o) == ArtifactLight:
+                                shutil.copyfile(store.artifact_path(key, o.name), kwargs[o.name])
+                        Executor.__store__(eg, literals, output_ids)
+                        if scheduler.tracer is not None:
+                            scheduler.tracer.complete(action.funcName, 'restore', start, Tracer.now(),
+                                                      args={'store': type(store).__name__})
+                        scheduler.complete(action, {})
+                        return None
+        if scheduler.tracer is not None:
+            scheduler.tracer.complete(action.funcName, 'bind', start, Tracer.now())
+        return kwargs, output_ids, key
 
+    @staticmethod
+    def __finish__(eg: ExperimentGraph, scheduler: "Scheduler", stores: "Stores", action: ActionLight, job, result):
+        """
+        Writes back the outputs of an action that ran, and adds them to the stores
+        :param job: See __prepare__
+        :param result: See __invoke__
+        """
+        kwargs, output_ids, key = job
+        response, measurements = result
+        start = Tracer.now()
+        Executor.__store__(eg, response, output_ids)
+        if key is not None:
+            artifacts = {o.name: kwargs[o.name] for o in eg.d[action] if type(o) == ArtifactLight}
+            for store in stores:
+                store.put(key, response, artifacts)
+        if scheduler.tracer is not None:
+            scheduler.tracer.complete(action.funcName, 'run', measurements['start'], measurements['end'],
+                                      measurements['pid'], measurements['tid'])
+            scheduler.tracer.complete(action.funcName, 'write', start, Tracer.now())
+        scheduler.complete(action, measurements)
 
+    @staticmethod
+    def execute(eg: ExperimentGraph, parallelism: int = 1, mode: str = 'process', history: History = None,
+                cores: int = None, rss: float = None, cache: Cache = None, journal: Journal = None,
+                tracer: Tracer = None):
+        """
+        Runs every action in the consolidated graph, respecting dependencies.
+        Scheduling is event-driven: an action is put on the ready queue by the completion of
+            its last producer, so no part of the graph is rescanned while waiting.
+        Ready actions start in order of their critical path (see Scheduler),
+            so long chains start early and workers stay busy until the end of the pull.
+        Concurrent actions are packed so that their cores and peak memory fit in the machine (see Scheduler).
+        :param eg: The consolidated experiment graph
+        :param parallelism: Number of workers. With 1, actions run inline, one after another,
+            unless the mode is 'async'
+        :param mode: 'process', 'thread' or 'async', how to run actions that do not set their own mode
+        :param history: Recorded runtimes and peak memory to schedule with. Updated and saved with the new measurements
+        :param cores: Number of cores actions may keep busy at once. Defaults to all the cores of the machine
+        :param rss: Resident memory actions may use at once, in MB. Defaults to the memory of the machine
+        :param cache: Results of previous runs. Actions whose function and inputs did not change are
+            restored from it instead of running, and the outputs of actions that run are added to it
+        :param journal: Log of the actions completed by this pull, so it can resume after a crash.
+            Actions recorded in it are restored instead of running
+        :param tracer: Records the wait, execution and output write of every action, see Tracer
+        """
+        if mode not in MODES:
+            raise ValueError("Unknown execution mode '{}', expected one of {}".format(mode, MODES))
+
+        scheduler = Scheduler(eg, history, cores, rss, tracer)
+        stores = Stores([store for store in (journal, cache) if store is not None])
+
+        try:
+            if mode == 'async':
+                Executor.__run_coroutine__(Executor.__execute_async__(eg, scheduler, stores, parallelism))
+            elif parallelism > 1:
+                Executor.__execute_pool__(eg, scheduler, stores, parallelism, mode)
+            else:
+                while scheduler:
+                    action = scheduler.pop()
+                    job = Executor.__prepare__(eg, scheduler, stores, action)
+                    if job is not None:
+                        result = Executor.__invoke__(action.func, job[0])
+                        Executor.__finish__(eg, scheduler, stores, action, job, result)
+        finally:
+            # Even if the pull fails, keep what completed
+            if journal is not None:
+                journal.flush()
+            if history is not None:
+                history.save()
+
+        assert scheduler.is_done(), "Failed: {} actions could not be scheduled".format(scheduler.num_pending)
 
+    @staticmethod
+    def __execute_pool__(eg: ExperimentGraph, scheduler: "Scheduler", stores: "Stores", parallelism: int, mode: str):
+        """
+        Dispatches ready actions to pools of workers, at most parallelism at a time,
+            and blocks until some action completes
+        Each action runs on a worker of its own mode (see flor.func), or of the pull's mode
+            * process: the function is shipped with cloudpickle, inputs and outputs are pickled
+            * thread: the function runs in this process, suited to I/O and GIL-releasing code
+        Either way, literal outputs are written back here with eg.update_value,
+            and artifact outputs are written by the workers to isolated locations, see __isolate_location__
+        """
+        pools = {}
+        pickled_funcs = {}
+        running = {}
+
+        try:
+            while scheduler or running:
+                while scheduler and len(running) < parallelism:
+                    action = scheduler.pop()
+                    if action is None:
+                        # No ready action fits in what is left of the machine
+                        break
+                    job = Executor.__prepare__(eg, scheduler, stores, action)
+                    if job is None:
+                        continue
+                    future = Executor.__submit__(pools, pickled_funcs, action, action.mode or mode,
+                                                 job[0], parallelism)
+                    running[future] = (action, job)
+
+                if not running:
+                    continue
+                start = Tracer.now()
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                if scheduler.tracer is not None:
+                    scheduler.tracer.complete('wait', 'engine', start, Tracer.now())
+
+                for future in finished:
+                    action, job = running.pop(future)
+                    Executor.__finish__(eg, scheduler, stores, action, job, future.result())
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
 
+    @staticmethod
+    async def __execute_async__(eg: ExperimentGraph, scheduler: "Scheduler", stores: "Stores", parallelism: int):
+        """
+        Runs all coroutine actions (async def) concurrently on one event loop.
+        Other actions are offloaded to a pool of their mode, 'thread' unless they set their own,
+            so waiting actions overlap without holding an OS thread each.
+        """
+        pools = {}
+        pickled_funcs = {}
+        running = {}
+
+        try:
+            while scheduler or running:
+                while scheduler:
+                    action = scheduler.pop()
+                    if action is None:
+                        break
+                    job = Executor.__prepare__(eg, scheduler, stores, action)
+                    if job is None:
+                        continue
+                    if action.coroutine and action.mode is None:
+                        future = asyncio.ensure_future(Executor.__invoke_async__(action.func, job[0]))
+                    else:
+                        future = asyncio.wrap_future(Executor.__submit__(
+                            pools, pickled_funcs, action, action.mode or 'thread', job[0], max(parallelism, 1)))
+                    running[future] = (action, job)
+
+                if not running:
+                    continue
+                start = Tracer.now()
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                if scheduler.tracer is not None:
+                    scheduler.tracer.complete('wait', 'engine', start, Tracer.now())
+
+                for future in finished:
+                    action, job = running.pop(future)
+                    Executor.__finish__(eg, scheduler, stores, action, job, future.result())
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+
+class Stores(list):
+    """
+    Helper class for Executor
+    The stores that may hold the outputs of an action (Journal, Cache), in order of lookup,
+        and the Fingerprinter that computes their keys
+    """
+
+    def __init__(self, stores):
+        super().__init__(stores)
+        self.fingerprinter = Fingerprinter()
+
+
+class Scheduler:
+    """
+    Helper class for Executor
+    Keeps, for every action, the number of its producing actions that have not completed yet
+    Actions whose producers have all completed are ready, and are popped by priority:
+        the cost of the longest chain of actions that starts with them (critical path).
+    Only actions that fit in the budget of cores and memory left by the running actions are popped
+    """
+
+    def __init__(self, eg: ExperimentGraph, history: History = None, cores: int = None, rss: float = None,
+                 tracer: Tracer = None):
+        """
+        :param cores: Budget of cores, defaults to the number of cores of the machine
+        :param rss: Budget of resident memory in MB, defaults to the physical memory of the machine
+        :param tracer: Records the wait of every action in the ready queue
+        """
+        self.eg = eg
+        self.history = history
+        self.tracer = tracer
+        # Maps each ready action to the time it became ready
+        self.ready_at = {}
+
+        self.cores = cores if cores is not None else (os.cpu_count() or 1)
+        self.rss = rss if rss is not None else Scheduler.__physical_memory__()
+        self.cores_in_use = 0
+        self.rss_in_use = 0
+        # Maps each running action to the cores and memory reserved for it
+        self.reserved = {}
+
+        self.in_degree = {}
+        self.consumers = {}
+        for depth in eg.actions_at_depth:
+            for action in eg.actions_at_depth[depth]:
+                self.in_degree[action] = len(Executor.__get_producing_actions__(eg, action))
+                self.consumers[action] = Executor.__get_consuming_actions__(eg, action)
+        self.num_pending = len(self.in_degree)
+
+        self.priority = self.__critical_path__()
+        self.heap = []
+        self.counter = 0
+        for action in self.in_degree:
+            if self.in_degree[action] == 0:
+                self.__push__(action)
+
+    def __critical_path__(self) -> Dict[ActionLight, float]:
+        """
+        Computes, for every action, the cost of the longest chain of actions that starts with it
+        The cost of an action is the recorded runtime of its function, if any, else the mean recorded runtime
+        Without a history, every action costs 1, and the critical path is counted in actions
+        :return: Dictionary mapping each ActionLight to the cost of its critical path
+        """
+        default = self.history.mean_runtime(1.0) if self.history is not None else 1.0
+
+        # The actions of the graph, in its topological order (see GraphIndex)
+        order = [v for v in self.eg.topological_order() if v in self.in_degree]
+
+        critical_path = {}
+        for action in reversed(order):
+            cost = self.history.runtime(action.funcName, default) if self.history is not None else default
+            critical_path[action] = cost + max([critical_path[child] for child in self.consumers[action]],
+                                               default=0)
+        return critical_path
+
+    def __push__(self, action: ActionLight):
+        # FIFO among actions of equal priority
+        heapq.heappush(self.heap, (-self.priority[action], self.counter, action))
+        self.counter += 1
+        if self.tracer is not None:
+            self.ready_at[action] = Tracer.now()
 
+    @staticmethod
+    def __physical_memory__() -> float:
+        try:
+            return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2 ** 20
+        except (ValueError, OSError, AttributeError):
+            return float('inf')
+
+    def __requirements__(self, action: ActionLight):
+        """
+        :return: The cores and peak resident memory (MB) of the action, declared or else measured
+        """
+        # Undeclared cores are only limited by the number of workers
+        cores = action.cores if action.cores is not None else 0
+        rss = action.rss
+        if rss is None:
+            rss = self.history.rss(action.funcName, 0) if self.history is not None else 0
+        return cores, rss
+
+    def __fits__(self, action: ActionLight):
+        if not self.reserved:
+            # Always make progress, even with an action larger than the whole budget
+            return True
+        cores, rss = self.__requirements__(action)
+        return self.cores_in_use + cores <= self.cores and self.rss_in_use + rss <= self.rss
+
+    def pop(self) -> Optional[ActionLight]:
+        """
+        Pops the ready action of highest priority that fits in the budget, and reserves its resources
+        :return: The action, or None if no ready action fits
+        """
+        skipped = []
+        action = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if self.__fits__(entry[2]):
+                action = entry[2]
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+
+        if action is not None:
+            cores, rss = self.__requirements__(action)
+            self.cores_in_use += cores
+            self.rss_in_use += rss
+            self.reserved[action] = (cores, rss)
+            if self.tracer is not None:
+                self.tracer.interval(action.funcName, 'queue', self.ready_at.pop(action), Tracer.now(), id(action))
+        return action
+
+    def complete(self, action: ActionLight, measurements):
+        """
+        Completion event: marks the action as done, releases its resources, records its measurements,
+            and releases onto the ready queue the consumers whose producers have all completed
+        """
+        cores, rss = self.reserved.pop(action)
+        self.cores_in_use -= cores
+        self.rss_in_use -= rss
+
+        action.pending = False
+        self.num_pending -= 1
+        if self.history is not None:
+            if 'runtime' in measurements:
+                self.history.record_runtime(action.funcName, measurements['runtime'])
+            if 'rss' in measurements:
+                self.history.record_rss(action.funcName, measurements['rss'])
+        for child in self.consumers[action]:
+            self.in_degree[child] -= 1
+            if self.in_degree[child] == 0:
+                self.__push__(child)
+
+    def is_done(self):
+        return self.num_pending == 0
+
+    def __len__(self):
+        """
+        :return: The number of ready actions
+        """
+        return len(self.heap)
@@ -2,8 +2,11 @@
 
 import itertools
 
-from flor.experiment_graph import ExperimentGraph
+from typing import Dict, Iterator, List, Sequence
+
+from flor.experiment_graph import ExperimentGraph, CompactExperimentGraph
 from flor.light_object_model import *
+from flor.engine.tracer import Tracer
 
 
 class Expander:
@@ -12,137 +15,196 @@ class Expander:
     """
 
     @staticmethod
-    def expand(eg: ExperimentGraph, pulled_resource):
+    def expand(eg: ExperimentGraph, pulled_resource, tracer: Tracer = None) -> Iterator[ExperimentGraph]:
         """
         Expands an experiment graph into a set of independent experiment graphs: one per trial.
         The Flor Objects are converted into specialized "Light" Flor Objects more suitable for execution
             and further processing.
+        The graphs are generated one at a time, so that only the graphs not yet consumed are in memory
         :param eg: The experiment graph constructed and populated by the Flor Plan
         :param pulled_resource: The Artifact or Literal object that was pulled
-        :return: LIST[ExperimentGraph], where the nodes of ExperimentGraph are in light_object_model rather
+        :param tracer: Records the expansion of each graph, see Tracer
+        :return: ITERATOR[ExperimentGraph], where the nodes of ExperimentGraph are in light_object_model rather
             than object_model
         """
-        starts_subset = eg.connected_starts[pulled_resource]
-        col_store, num_trials = Expander.__cross_prod_literals__(starts_subset)
+        order = Expander.__topological_order__(eg.connected_starts[pulled_resource], eg)
+        trial_space = Expander.trial_space(eg, pulled_resource)
 
-        experiment_graphs = []
+        for i in range(len(trial_space)):
+            # The span ends before the yield, so it does not cover the consumer of the graph
+            with Tracer.optional(tracer, 'expand', args={'trial': i}):
+                new_eg = ExperimentGraph()
+                Expander.__bfs__(order, eg, new_eg, trial_space[i])
+            yield new_eg
 
-        for i in range(num_trials):
-            new_eg = ExperimentGraph()
-            Expander.__bfs__(starts_subset, eg, new_eg, col_store, i)
-            experiment_graphs.append(new_eg)
+    @staticmethod
+    def expand_shared(eg: ExperimentGraph, pulled_resource, compact: bool = False) -> ExperimentGraph:
+        """
+        Expands an experiment graph directly into the consolidated experiment graph of its trials.
+        Each node is instantiated once per combination of values of the root literals it depends on
+            (see connected_starts), rather than once per trial, so the work trials share is expanded once.
+        Equivalent to Consolidator.consolidate(Expander.expand(eg, pulled_resource)),
+            in time proportional to the size of the consolidated graph
+        :param eg: The experiment graph constructed and populated by the Flor Plan
+        :param pulled_resource: The Artifact or Literal object that was pulled
+        :param compact: Whether to build a CompactExperimentGraph, which takes a fraction of the memory
+        :return: One consolidated experiment graph with "Light" versions of the object model
+        """
+        starts_subset = eg.connected_starts[pulled_resource]
+        trial_space = Expander.trial_space(eg, pulled_resource)
+        positions = {name: idx for idx, name in enumerate(trial_space.literal_names)}
+
+        dest_eg = CompactExperimentGraph() if compact else ExperimentGraph()
+        # Maps each node to the positions (in trial_space) of the root literals it depends on
+        dependencies = {}
+        # Maps each node to its instances, keyed by the value indices of the literals it depends on
+        instances = {}
+
+        for node in Expander.__topological_order__(starts_subset, eg):
+            dependencies[node] = sorted(positions[start.name] for start in eg.connected_starts[node]
+                                        if type(start).__name__ == "Literal" and start.name in positions)
+            instances[node] = {}
+            parents = [parent for parent in eg.b[node] if parent in instances]
+            # Where the literals of each parent are found in the key of node: they are a subset of node's
+            projections = {parent: [dependencies[node].index(p) for p in dependencies[parent]] for parent in parents}
+
+            for key in itertools.product(*[range(trial_space.radices[p]) for p in dependencies[node]]):
+                if type(node).__name__ == "Literal" and node.name in positions:
+                    light = Expander.__light__(node, trial_space.value(positions[node.name], key[0]))
+                else:
+                    light = Expander.__light__(node)
+                dest_eg.light_node(light)
+                instances[node][key] = light
+                # Parents come first in topological order, so their depth is final when the edge is drawn
+                for parent in parents:
+                    dest_eg.edge(instances[parent][tuple(key[i] for i in projections[parent])], light)
 
-        return experiment_graphs
+        return dest_eg
 
     @staticmethod
-    def __const_literal_col_store__(literals, literal_names):
+    def __topological_order__(starts, src_eg: ExperimentGraph) -> List:
         """
-        Subroutine of cross_prod_literals
-
-        :param literals: cross product of input literals [(lit1_1, lit2_1), (lit1_1, lit2_2), (lit1_2, lit2_1), (lit1_2, lit2_2)]
-        :param literal_names: a list of names for the literals ["lit1name", "lit2name"]
-        :return: {
-            "lit1name" : [lit1_1, lit1_1, lit1_2, lit1_2],
-            "lit2name" : [lit2_1, lit2_2, lit2_1, lit2_2]
-        }
-        """
-        col_store = {}
-        for idx, val in enumerate(literals[0]):
-            col_store[literal_names[idx]] = [val, ]
-        for each in literals[1:]:
-            for idx, val in enumerate(each):
-                col_store[literal_names[idx]].append(val)
-        return col_store
+        :param starts: The starts set of the source experiment graph
+        :param src_eg: The source experiment graph (containing Flor Objects)
+        :return: The nodes reachable from starts, each after its parents
+        """
+        reachable = set(starts)
+        for start in starts:
+            reachable |= src_eg.descendants(start)
+        return [node for node in src_eg.topological_order() if node in reachable]
 
     @staticmethod
-    def __cross_prod_literals__(starts_subset):
+    def trial_space(eg: ExperimentGraph, pulled_resource) -> 'TrialSpace':
         """
-        Takes the cross product of all the root literals (those with statically defined values)
-        The method handles cases where the literal value is iterated over or not.
-        In addition to calculating the cross product,
-            The name of the literal is preserved, so that we may assign the right values (configuration)
-            to each literal.
-        :param starts_subset: The starts set that is connected to pull artifact
-        :return: see const_literal_col_store, (int) number of trials
+        :param eg: The experiment graph constructed and populated by the Flor Plan
+        :param pulled_resource: The Artifact or Literal object that was pulled
+        :return: The trials of the experiment, see TrialSpace
         """
         literal_names = []
         literals = []
-        for each in starts_subset:
+        for each in eg.connected_starts[pulled_resource]:
             if type(each).__name__ == "Literal":
                 if each.__oneByOne__:
                     literals.append(each.v)
                 else:
-                    if type(each.v) == tuple:
-                        literals.append((each.v, ))
-                    else:
-                        literals.append([each.v, ])
+                    literals.append((each.v, ))
                 literal_names.append(each.name)
+        return TrialSpace(literal_names, literals)
 
-        literals = list(itertools.product(*literals))
-        num_trials = len(literals)
-
-        return Expander.__const_literal_col_store__(literals, literal_names), num_trials
+    @staticmethod
+    def __light__(node, value=None):
+        """
+        :param node: A Flor Object of the source experiment graph
+        :param value: If node is a root Literal, its value in the trial
+        :return: The Light Flor Object corresponding to node
+        """
+        if type(node).__name__ == "Action":
+            return ActionLight(node.funcName, node.func)
+        elif type(node).__name__ == "Artifact":
+            return ArtifactLight(node.loc, node.name)
+        elif type(node).__name__ == "Literal":
+            return LiteralLight(value, node.name)
+        else:
+            raise TypeError("Invalid node type: {}".format(type(node)))
 
     @staticmethod
-    def __bfs__(starts, src_eg: ExperimentGraph,
-                dest_eg: ExperimentGraph, col_store,
-                trial_index: int):
+    def __bfs__(order, src_eg: ExperimentGraph,
+                dest_eg: ExperimentGraph, bindings: Dict[str, object]):
         """
-        By traversing every node of the source experiment graph twice, with graph-traversal,
+        By traversing every node of the source experiment graph twice, in topological order,
         populates the new experiment graph with the corresponding Light Flor Objects
         And draws edges between the nodes, respecting the original structure of the source exp. graph
-        :param starts: The starts set of the source experiment graph
+        :param order: The nodes of the source experiment graph reachable from the starts set, see __topological_order__
+            Drawing the edges in this order makes the depth of each node final before its children's
         :param src_eg: The source experiment graph (containing Flor Objects)
         :param dest_eg: The destination experiment graph, corresponds to one trial of the experiment,
             contains Light Flor Objects.
-        :param col_store: A dictionary mapping literal name to array of values. The length of the array
-            corresponds to the number of trials, col_store is indexed to determine what value to initialize
-            the light flor literal with.
-        :param trial_index: The index of the trial to which this call of __bfs__ corresponds
+        :param bindings: A dictionary mapping literal name to its value in the trial, see TrialSpace
         :return: None. But outcome is the populated dest_eg
         """
         # Make the nodes
-        explored = []
-        queue = [i for i in starts]
         src_dest_map = {}
-
-        while queue:
-            node = queue.pop(0)
-            if type(node).__name__ == "Action":
-                light = ActionLight(node.funcName, node.func)
-                dest_eg.light_node(light)
-            elif type(node).__name__ == "Artifact":
-                light = ArtifactLight(node.loc, node.name)
-                dest_eg.light_node(light)
-            elif type(node).__name__ == "Literal":
-                if node.name in col_store:
-                    light = LiteralLight(col_store[node.name][trial_index], node.name)
-                    dest_eg.light_node(light)
-                else:
-                    light = LiteralLight(None, node.name)
-                    dest_eg.light_node(light)
+        for node in order:
+            if type(node).__name__ == "Literal":
+                light = Expander.__light__(node, bindings.get(node.name))
             else:
-                raise TypeError("Invalid node type: {}".format(type(node)))
-
+                light = Expander.__light__(node)
+            dest_eg.light_node(light)
             src_dest_map[node] = light
-            explored.append(node)
-
-            for child in src_eg.d[node]:
-                if child not in (explored + queue):
-                    queue.append(child)
 
         # Make the edges
-        explored = []
-        queue = [i for i in starts]
-
-        while queue:
-            node = queue.pop(0)
-
+        for node in order:
             for each in src_eg.d[node]:
                 dest_eg.edge(src_dest_map[node], src_dest_map[each])
 
-            explored.append(node)
 
-            for child in src_eg.d[node]:
-                if child not in (explored + queue):
-                    queue.append(child)
+class TrialSpace:
+    """
+    Helper class for Expander
+    The cross product of the root literals, without materializing it.
+    Trial i is decoded into the values of the literals by mixed-radix arithmetic:
+        the radix of each literal is its number of values, and the last literal varies fastest,
+        in the order of itertools.product
+    """
+
+    def __init__(self, literal_names: List[str], literals: List[Sequence]):
+        """
+        :param literal_names: a list of names for the literals ["lit1name", "lit2name"]
+        :param literals: the values of each literal, any sequence that supports len and indexing
+            (list, tuple, range, numpy array) [[lit1_1, lit1_2], range(10)]
+        """
+        self.literal_names = literal_names
+        self.literals = literals
+        self.radices = [len(values) for values in literals]
+        # Values decoded so far, by literal and index. Indexing a range or an array creates a new object
+        #   every time, so the trials that bind the same value share one object
+        self.values = [{} for _ in literals]
+
+        self.num_trials = 1
+        for radix in self.radices:
+            self.num_trials *= radix
+
+    def __len__(self):
+        return self.num_trials
+
+    def __getitem__(self, trial_index: int) -> Dict[str, object]:
+        """
+        :param trial_index: The index of the trial, in [0, len(self))
+        :return: {"lit1name": lit1_j, "lit2name": lit2_k} the value of each literal in the trial
+        """
+        if not 0 <= trial_index < self.num_trials:
+            raise IndexError("Trial index {} out of range".format(trial_index))
+        bindings = {}
+        for idx in reversed(range(len(self.radices))):
+            trial_index, digit = divmod(trial_index, self.radices[idx])
+            bindings[self.literal_names[idx]] = self.value(idx, digit)
+        return bindings
+
+    def value(self, idx: int, digit: int):
+        """
+        :return: The value of index digit of the literal at position idx, interned
+        """
+        values = self.values[idx]
+        if digit not in values:
+            values[digit] = self.literals[idx][digit]
+        return values[digit]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+import hashlib
+import inspect
+import os
+
+from typing import Optional
+
+import cloudpickle as dill
+
+from flor import global_state
+from flor import util
+from flor.light_object_model import *
+
+
+class Fingerprinter:
+    """
+    Computes content fingerprints of actions: the digest of the function's source and of its inputs
+    Two actions with the same fingerprint produce the same outputs, so the Cache and the Journal key on it
+    """
+
+    def __init__(self, versioningDirectory=None):
+        """
+        :param versioningDirectory: Where the checksums of the input files are cached. By default, the one of State()
+        """
+        # Maps the id of a function to the digest of its source
+        self.func_digests = {}
+        self.versioningDirectory = versioningDirectory
+
+    def func_digest(self, func) -> str:
+        """
+        Digest of the function's source, and of the globals and closure variables it references,
+            so it changes with the function but not with the rest of the script that defines it
+        """
+        if id(func) not in self.func_digests:
+            # Guards against recursion through functions that reference each other
+            self.func_digests[id(func)] = ''
+            hash_md5 = hashlib.md5()
+            try:
+                hash_md5.update(inspect.getsource(func).encode('utf-8'))
+            except (OSError, TypeError):
+                hash_md5.update(dill.dumps(func))
+            for name, value in Fingerprinter.__references__(func):
+                hash_md5.update(name.encode('utf-8'))
+                hash_md5.update(self.__value_digest__(value).encode('utf-8'))
+            self.func_digests[id(func)] = hash_md5.hexdigest()
+        return self.func_digests[id(func)]
+
+    @staticmethod
+    def __references__(func):
+        """
+        :return: The globals and closure variables referenced by the function (and the functions nested in it),
+            as pairs of name and value, sorted by name
+        """
+        code = getattr(func, '__code__', None)
+        if code is None:
+            return []
+        names = set([])
+        codes = [code, ]
+        while codes:
+            c = codes.pop()
+            names.update(c.co_names)
+            codes.extend(const for const in c.co_consts if inspect.iscode(const))
+        func_globals = getattr(func, '__globals__', {})
+        references = [(name, func_globals[name]) for name in names if name in func_globals]
+        for name, cell in zip(code.co_freevars, func.__closure__ or ()):
+            try:
+                references.append((name, cell.cell_contents))
+            except ValueError:
+                # Cell not yet bound
+                continue
+        return sorted(references, key=lambda reference: reference[0])
+
+    def __value_digest__(self, value) -> str:
+        if inspect.ismodule(value):
+            return value.__name__
+        elif inspect.isfunction(value):
+            return self.func_digest(value)
+        elif inspect.isclass(value):
+            return '{}.{}'.format(value.__module__, value.__qualname__)
+        elif type(value) == tuple and len(value) == 3 and inspect.isfunction(value[2]):
+            # A function decorated with flor.func
+            return self.func_digest(value[2])
+        return util.digest(value) or type(value).__name__
+
+    @staticmethod
+    def __script__(func) -> Optional[str]:
+        """
+        :return: The name of the Flor script or notebook that defines func,
+            the location of the code artifact that Experiment.action adds to the inputs of its action
+        """
+        if global_state.interactive:
+            return global_state.nb_name
+        try:
+            return os.path.basename(inspect.getsourcefile(func))
+        except TypeError:
+            return None
+
+    def fingerprint(self, action: ActionLight, inputs, outputs, kwargs) -> Optional[str]:
+        """
+        :param action: The action to fingerprint
+        :param inputs: The input resources of the action, eg.b[action]
+        :param outputs: The output resources of the action, eg.d[action]
+        :param kwargs: The keyword arguments of the action's function, see Executor.__bind__
+        :return: The fingerprint of the action, or None if some input cannot be fingerprinted
+        """
+        hash_md5 = hashlib.md5()
+        hash_md5.update(action.funcName.encode('utf-8'))
+        hash_md5.update(self.func_digest(action.func).encode('utf-8'))
+
+        script = Fingerprinter.__script__(action.func)
+        if self.versioningDirectory is None:
+            # Resolved once, State() inspects the stack
+            from flor.stateful import State
+            self.versioningDirectory = State().versioningDirectory
+        for i in sorted(inputs, key=lambda x: x.name):
+            if type(i) == ArtifactLight and i.loc == script:
+                # The script changes with every edit, eg. to a literal. func_digest covers the code the action runs
+                continue
+            hash_md5.update(i.name.encode('utf-8'))
+            if type(i) == ArtifactLight:
+                if os.path.isfile(kwargs[i.name]):
+                    hash_md5.update(util.md5(kwargs[i.name], self.versioningDirectory).encode('utf-8'))
+                elif os.path.isfile(i.loc):
+                    hash_md5.update(util.md5(i.loc, self.versioningDirectory).encode('utf-8'))
+                else:
+                    hash_md5.update(i.loc.encode('utf-8'))
+            else:
+                value_digest = i.digest()
+                if value_digest is None:
+                    return None
+                hash_md5.update(value_digest.encode('utf-8'))
+
+        for o in sorted(outputs, key=lambda x: x.name):
+            hash_md5.update("{}:{}".format(type(o).__name__, o.name).encode('utf-8'))
+
+        return hash_md5.hexdigest()
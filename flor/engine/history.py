@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import json
+import os
+
+# Weight of the newest measurement in the moving average
+ALPHA = 0.5
+
+
+class History:
+    """
+    Measured cost of flor functions, keyed by funcName and persisted across pulls
+    The Executor uses it to prioritize long chains of expensive actions,
+        and to keep memory-heavy actions from running together
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: JSON file backing the history. If None, the history lives in memory only
+        """
+        self.path = path
+        self.runtimes = {}
+        self.peak_rss = {}
+
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                record = json.load(f)
+            self.runtimes = record['runtimes']
+            self.peak_rss = record.get('peak_rss', {})
+
+    def runtime(self, funcName, default=None):
+        """
+        :return: The average runtime of the function, in seconds
+        """
+        return self.runtimes.get(funcName, default)
+
+    def mean_runtime(self, default=None):
+        if not self.runtimes:
+            return default
+        return sum(self.runtimes.values()) / len(self.runtimes)
+
+    def record_runtime(self, funcName, seconds):
+        if funcName in self.runtimes:
+            self.runtimes[funcName] = ALPHA * seconds + (1 - ALPHA) * self.runtimes[funcName]
+        else:
+            self.runtimes[funcName] = seconds
+
+    def rss(self, funcName, default=None):
+        """
+        :return: The largest peak resident memory measured for the function, in MB
+        """
+        return self.peak_rss.get(funcName, default)
+
+    def record_rss(self, funcName, megabytes):
+        self.peak_rss[funcName] = max(megabytes, self.peak_rss.get(funcName, 0))
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({'runtimes': self.runtimes, 'peak_rss': self.peak_rss}, f)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import os
+import pickle
+import time
+
+from typing import Dict, Optional
+
+import cloudpickle as dill
+
+# A batch of records is written when it has this many records, or is this old (seconds)
+BATCH_SIZE = 64
+BATCH_INTERVAL = 1.0
+
+
+class Journal:
+    """
+    Durable log of the actions completed by a pull, keyed by fingerprint (see Fingerprinter)
+    A record holds the output literals of the action and the paths of the artifacts it wrote.
+    Records are appended in batches, so a crash loses at most the last batch.
+    Resuming a pull replays the journal: the recorded actions are restored instead of running again.
+    """
+
+    def __init__(self, path, resume=False):
+        """
+        :param path: File of the journal
+        :param resume: Whether to replay the existing journal. Otherwise it is started over
+        """
+        self.path = path
+        # Maps each fingerprint to its output literals and artifact paths
+        self.records = {}
+        self.batch = []
+        self.last_write = time.time()
+
+        if resume and os.path.exists(path):
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        key, literals, artifacts = pickle.load(f)
+                    except (EOFError, pickle.UnpicklingError, ValueError):
+                        # End of the journal, or a batch torn by the crash
+                        break
+                    self.records[key] = (literals, artifacts)
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def get(self, key) -> Optional[Dict[str, object]]:
+        """
+        :return: The recorded output literals of the action, by name, or None if it did not complete.
+            Output artifacts are read with artifact_path
+        """
+        if key not in self.records:
+            return None
+        literals, artifacts = self.records[key]
+        if not all(map(os.path.isfile, artifacts.values())):
+            # The artifacts were removed since, so the action must run again
+            return None
+        return literals
+
+    def artifact_path(self, key, name):
+        return self.records[key][1][name]
+
+    def put(self, key, literals: Dict[str, object], artifacts: Dict[str, str]):
+        """
+        Records a completed action. Outputs that cannot be pickled are not recorded
+        :param literals: Maps the name of each output literal to its value
+        :param artifacts: Maps the name of each output artifact to the file the action wrote
+        """
+        artifacts = {name: os.path.abspath(artifacts[name]) for name in artifacts}
+        try:
+            self.batch.append(dill.dumps((key, literals, artifacts)))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        self.records[key] = (literals, artifacts)
+        if len(self.batch) >= BATCH_SIZE or time.time() - self.last_write >= BATCH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(self.batch))
+                f.flush()
+                os.fsync(f.fileno())
+            self.batch = []
+        self.last_write = time.time()
+
+    def discard(self):
+        """
+        Removes the journal, once the pull it records has completed
+        """
+        self.batch = []
+        self.records = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+
+from typing import Dict, List, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from flor import util
+from flor.engine.stat_cache import StatCache
+
+# Files at least this large are kept out of git, and committed as a pointer in the manifest
+LARGE_FILE = 2 ** 20
+
+# Directory of the store, under versioningDirectory
+OBJECTS = '.objects'
+MANIFEST = '.flor_objects.json'
+CHUNK_SIZE = 2 ** 20
+# Number of paths per git add, to stay within the bounds of a command line
+STAGE_BATCH = 512
+# Lines around the large files listed in .git/info/exclude, which are rewritten with each manifest
+EXCLUDE_BEGIN = '# flor: large files, see ' + MANIFEST
+EXCLUDE_END = '# end flor'
+
+# ioctl of Linux that clones a file into another, sharing its blocks
+FICLONE = 0x40049409
+
+
+class ObjectStore:
+    """
+    Content-addressed store of the files versioned by flor, under versioningDirectory
+    Each distinct file is kept once, keyed by its digest, and the snapshots of an experiment
+        (the trial directories of every version) are clones of it.
+    Large files are not added to git: the manifest of a snapshot maps their paths to digests,
+        and restore clones them back after a git checkout.
+    The files of a snapshot are not links to the objects: a write to one of them, even by root or after a chmod,
+        leaves the store and the other snapshots as they were. Where the file system supports reflinks,
+        a clone shares the blocks of its object until it is written, so a file still takes its bytes on disk once.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Directory of the store, created on first write
+        """
+        self.path = path
+
+    @staticmethod
+    def digest(path) -> str:
+        hash_blake2b = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hash_blake2b.update(chunk)
+        return hash_blake2b.hexdigest()
+
+    def object_path(self, digest):
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def put(self, path, digest=None) -> str:
+        """
+        Stores a copy of the file, unless the store already holds the same content
+        :param digest: The digest of the file, if known
+        :return: The digest of the file
+        """
+        digest = digest or ObjectStore.digest(path)
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            fd, staging = tempfile.mkstemp(dir=os.path.dirname(object_path), prefix='.')
+            os.close(fd)
+            try:
+                ObjectStore.__copy__(path, staging)
+                os.chmod(staging, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.replace(staging, object_path)
+            except OSError:
+                if os.path.exists(staging):
+                    os.remove(staging)
+                raise
+        return digest
+
+    @staticmethod
+    def __copy__(src, dst):
+        """
+        Clones src to dst where the file system supports reflinks (btrfs, xfs, ...), so they share their blocks
+            until one of them is written. Otherwise copies it
+        """
+        if fcntl is not None and sys.platform.startswith('linux'):
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                try:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                    return
+                except OSError:
+                    pass
+        shutil.copyfile(src, dst)
+
+    def holds(self, digest, path, stat_cache: StatCache) -> bool:
+        """
+        Whether the file at path has the content of the object
+        :param stat_cache: Digests of the files of the snapshot by their stat, so only the files that changed are read
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        held = stat_cache.get(path, st)
+        if held is None:
+            if st.st_size != os.stat(self.object_path(digest)).st_size:
+                return False
+            held = ObjectStore.digest(path)
+            stat_cache.put(path, held, st)
+        return held == digest
+
+    def clone(self, digest, dst, stat_cache: StatCache):
+        """
+        Clones the object to dst, a writable file of its own
+        dst is replaced atomically, so readers of the snapshot see either the old file or the new one
+        dst takes the mtime of the object, which a later write to dst changes, so its digest is cached right away
+        """
+        object_path = self.object_path(digest)
+        staging = os.path.join(os.path.dirname(dst), '.' + os.path.basename(dst) + '.flor')
+        if os.path.lexists(staging):
+            os.remove(staging)
+        ObjectStore.__copy__(object_path, staging)
+        st = os.stat(object_path)
+        os.utime(staging, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(staging, dst)
+        stat_cache.put(dst, digest)
+
+    def snapshot(self, src, dst, stat_cache: StatCache = None) -> Tuple[List[str], List[str]]:
+        """
+        Mirrors the directory src into dst, as copytree would, with clones of the objects of the store
+        If dst holds an earlier snapshot, only the files that changed are cloned again, and the files
+            removed from src are removed from dst. The .git directory of dst is left as is, and the one of src skipped.
+        Writes the manifest of the large files at the root of dst
+        :param stat_cache: Digests of the files of src and dst by their stat, so only the files that changed are read
+        :return: The paths, relative to dst, of the files that were written (including the manifest), and removed
+        """
+        stat_cache = stat_cache or StatCache()
+        manifest = {}
+        mirrored = {MANIFEST, }
+        changed = [MANIFEST, ]
+        removed = []
+        for root, dirs, files in os.walk(src):
+            relative = os.path.relpath(root, src)
+            if relative == os.curdir and '.git' in dirs:
+                dirs.remove('.git')
+            os.makedirs(os.path.normpath(os.path.join(dst, relative)), exist_ok=True)
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Broken symlink
+                    continue
+                if not stat.S_ISREG(st.st_mode):
+                    continue
+                digest = stat_cache.get(path, st)
+                if digest is None:
+                    digest = ObjectStore.digest(path)
+                    stat_cache.put(path, digest, st)
+                self.put(path, digest)
+                target = os.path.normpath(os.path.join(relative, name))
+                mirrored.add(target)
+                if not self.holds(digest, os.path.join(dst, target), stat_cache):
+                    self.clone(digest, os.path.join(dst, target), stat_cache)
+                    changed.append(target)
+                if st.st_size >= LARGE_FILE:
+                    manifest[target] = digest
+
+        for root, dirs, files in os.walk(dst, topdown=False):
+            relative = os.path.relpath(root, dst)
+            if relative == '.git' or relative.startswith('.git' + os.sep):
+                continue
+            for name in files:
+                if os.path.normpath(os.path.join(relative, name)) not in mirrored:
+                    os.remove(os.path.join(root, name))
+                    removed.append(os.path.normpath(os.path.join(relative, name)))
+            if relative != os.curdir and not os.path.isdir(os.path.join(src, relative)):
+                shutil.rmtree(root, ignore_errors=True)
+
+        self.__write_manifest__(dst, manifest)
+        stat_cache.save()
+        return changed, removed
+
+    def stage(self, repo, changed, removed):
+        """
+        Stages the delta of a snapshot in its git repository, so git does not rescan the whole snapshot
+        Large files are left out, the manifest points to them
+        :param repo: The git.Repo of the snapshot
+        :param changed: The paths written by snapshot
+        :param removed: The paths removed by snapshot
+        """
+        manifest = ObjectStore.manifest(repo.working_tree_dir)
+        # Large files committed before the manifest pointed to them leave the index
+        removed = removed + [target for target in changed if target in manifest]
+        changed = [target for target in changed if target not in manifest]
+        # git add fails on ignored paths, eg. logs that match the .gitignore of the experiment
+        ignored = ObjectStore.__ignored__(repo.working_tree_dir, changed)
+        changed = [target for target in changed if target not in ignored]
+        for i in range(0, len(changed), STAGE_BATCH):
+            repo.git.add('--', *changed[i:i + STAGE_BATCH])
+        for i in range(0, len(removed), STAGE_BATCH):
+            repo.git.rm('--cached', '--ignore-unmatch', '-q', '--', *removed[i:i + STAGE_BATCH])
+
+    @staticmethod
+    def __ignored__(directory, targets) -> Set[str]:
+        """
+        :return: The targets that git ignores in the repository at directory, and does not track
+        """
+        if not targets:
+            return set([])
+        process = subprocess.run(['git', 'check-ignore', '-z', '--stdin'], cwd=directory,
+                                 input='\0'.join(targets).encode('utf-8'), stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        # Exit status 1: none of the targets is ignored
+        if process.returncode not in (0, 1):
+            raise subprocess.CalledProcessError(process.returncode, process.args, process.stdout, process.stderr)
+        return set(target for target in process.stdout.decode('utf-8').split('\0') if target)
+
+    def __write_manifest__(self, directory, manifest):
+        with open(os.path.join(directory, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=0, sort_keys=True)
+        # Git versions the manifest instead of the large files it points to
+        ObjectStore.__write_exclude__(directory, manifest)
+
+    @staticmethod
+    def __read_exclude__(directory) -> Tuple[List[str], List[str]]:
+        """
+        :return: The lines of .git/info/exclude outside of the block of flor, and the paths listed in it
+        """
+        exclude = os.path.join(directory, '.git', 'info', 'exclude')
+        lines, excluded = [], []
+        if os.path.exists(exclude):
+            with open(exclude, 'r') as f:
+                block = False
+                for line in f.read().splitlines():
+                    if line == EXCLUDE_BEGIN or line == EXCLUDE_END:
+                        block = line == EXCLUDE_BEGIN
+                    elif block:
+                        excluded.append(line[1:])
+                    else:
+                        lines.append(line)
+        return lines, excluded
+
+    @staticmethod
+    def __write_exclude__(directory, manifest):
+        """
+        Rewrites the block of flor in .git/info/exclude, so it lists the large files of manifest only:
+            a file that is no longer large goes back to git
+        """
+        if not os.path.isdir(os.path.join(directory, '.git')):
+            return
+        lines, excluded = ObjectStore.__read_exclude__(directory)
+        if excluded == sorted(manifest):
+            return
+        if manifest:
+            lines += [EXCLUDE_BEGIN, ] + ['/' + target for target in sorted(manifest)] + [EXCLUDE_END, ]
+        exclude = os.path.join(directory, '.git', 'info', 'exclude')
+        os.makedirs(os.path.dirname(exclude), exist_ok=True)
+        with open(exclude, 'w') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def exclude(self, directory):
+        """
+        Keeps the large files of the snapshot in directory out of git
+        Call it once directory is a git repository, before adding its files
+        """
+        self.__write_manifest__(directory, ObjectStore.manifest(directory))
+
+    @staticmethod
+    def manifest(directory) -> Dict[str, str]:
+        path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def restore(self, directory, stat_cache: StatCache = None):
+        """
+        Clones the large files of the snapshot checked out in directory, after a git checkout
+        Large files of other versions, that this one neither has nor versions in git, are removed
+        :param stat_cache: Digests of the files of directory by their stat, so only the files that changed are read
+        """
+        stat_cache = stat_cache or StatCache()
+        manifest = ObjectStore.manifest(directory)
+        _, excluded = ObjectStore.__read_exclude__(directory)
+        stale = [target for target in excluded
+                 if target not in manifest and os.path.isfile(os.path.join(directory, target))]
+        if stale:
+            # A large file of the last version may be a small file of this one, which git just checked out
+            tracked = subprocess.check_output(['git', 'ls-files', '-z', '--'] + stale, cwd=directory)
+            tracked = set(os.path.normpath(target) for target in tracked.decode('utf-8').split('\0') if target)
+            for target in stale:
+                if target not in tracked:
+                    os.remove(os.path.join(directory, target))
+        for target, digest in manifest.items():
+            path = os.path.join(directory, target)
+            if self.holds(digest, path, stat_cache):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.clone(digest, path, stat_cache)
+        ObjectStore.__write_exclude__(directory, manifest)
+        stat_cache.save()
+
+    def checkout(self, directory, version, stat_cache: StatCache = None):
+        """
+        Checks out a version of the experiment repository in directory, with its large files
+        """
+        with util.chinto(directory):
+            util.runProc('git checkout ' + version)
+        self.restore(directory, stat_cache)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+
+from typing import Optional
+
+# A file modified this recently (nanoseconds) may be modified again within the same mtime, so it is not cached
+RACY_NS = 2 * 10 ** 9
+
+
+class StatCache:
+    """
+    Persistent map from the stat of a file (size, mtime, inode, device) to the digest of its content
+    A file whose stat did not change since it was hashed is not read again.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: JSON file backing the cache. If None, the cache lives in memory only
+        """
+        self.path = path
+        # Maps the absolute path of each file to [size, mtime_ns, inode, device, digest]
+        self.records = {}
+        self.dirty = False
+
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.records = json.load(f)
+            except (OSError, ValueError):
+                # A torn cache is only a slower exit
+                self.records = {}
+
+    @staticmethod
+    def __key__(st):
+        return [st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev]
+
+    def get(self, path, st: os.stat_result = None) -> Optional[str]:
+        """
+        :param st: The stat of the file, if the caller has it
+        :return: The digest of the file, or None if it changed since it was hashed
+        """
+        record = self.records.get(os.path.abspath(path))
+        if record is None:
+            return None
+        st = st or os.stat(path)
+        if record[:4] != StatCache.__key__(st):
+            return None
+        return record[4]
+
+    def put(self, path, digest, st: os.stat_result = None):
+        st = st or os.stat(path)
+        if time.time_ns() - st.st_mtime_ns < RACY_NS:
+            return
+        self.records[os.path.abspath(path)] = StatCache.__key__(st) + [digest, ]
+        self.dirty = True
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        staging = self.path + '.tmp'
+        with open(staging, 'w') as f:
+            json.dump(self.records, f)
+        os.replace(staging, self.path)
+        self.dirty = False
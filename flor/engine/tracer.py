@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+
+class Tracer:
+    """
+    Records timed spans of a pull: the engine phases, and for each action its wait in the ready queue,
+        its execution and the write of its outputs.
+    Saves them as a Chrome trace-event JSON file, which opens in Perfetto (ui.perfetto.dev) or chrome://tracing
+    Recording a span only appends a tuple, the events are formatted on save.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The JSON file to write on save
+        """
+        self.path = path
+        self.pid = os.getpid()
+        self.origin = time.perf_counter_ns()
+        # Tuples of (phase, name, category, start_ns, end_ns, pid, tid, args)
+        self.events = []
+
+    @staticmethod
+    def now():
+        # Monotonic and system-wide, so worker processes share the clock
+        return time.perf_counter_ns()
+
+    def complete(self, name, category, start, end, pid=None, tid=None, args=None):
+        """
+        Records a span on a thread, spans on the same thread must nest
+        """
+        self.events.append(('X', name, category, start, end,
+                            pid or self.pid, tid or threading.get_native_id(), args))
+
+    def interval(self, name, category, start, end, key, args=None):
+        """
+        Records a span that may overlap others, e.g. the wait of an action in the ready queue
+        :param key: Identifies the span, unique among the spans of the category
+        """
+        self.events.append(('b', name, category, start, end, self.pid, key, args))
+
+    @contextmanager
+    def span(self, name, category='engine', args=None):
+        start = Tracer.now()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, Tracer.now(), args=args)
+
+    @staticmethod
+    def optional(tracer: Optional['Tracer'], name, category='engine', args=None):
+        """
+        :return: The span of tracer, or a context that records nothing if tracer is None (not tracing)
+        """
+        return tracer.span(name, category, args) if tracer is not None else nullcontext()
+
+    def save(self):
+        def ts(ns):
+            return (ns - self.origin) / 1000
+
+        trace = []
+        for pid in set(event[5] for event in self.events) | {self.pid, }:
+            trace.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                          'args': {'name': 'flor' if pid == self.pid else 'flor worker {}'.format(pid)}})
+
+        for phase, name, category, start, end, pid, tid, args in self.events:
+            if phase == 'X':
+                event = {'name': name, 'cat': category, 'ph': 'X', 'ts': ts(start), 'dur': (end - start) / 1000,
+                         'pid': pid, 'tid': tid}
+                if args:
+                    event['args'] = args
+                trace.append(event)
+            else:
+                begin = {'name': name, 'cat': category, 'ph': 'b', 'ts': ts(start), 'pid': pid, 'id': tid}
+                if args:
+                    begin['args'] = args
+                trace.append(begin)
+                trace.append({'name': name, 'cat': category, 'ph': 'e', 'ts': ts(end), 'pid': pid, 'id': tid})
+
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
@@ -13,14 +13,13 @@ import flor.above_ground as ag
 from flor.jground import GroundClient
 from flor.object_model import *
 from flor.decorators import func
+from flor.engine.object_store import ObjectStore, OBJECTS
+from flor.engine.stat_cache import StatCache
 from flor.experiment_graph import ExperimentGraph
 from flor.stateful import State
 
 from ground.client import GroundClient
 from grit.client import GroundClient as GritClient
-from shutil import copytree
-from shutil import rmtree
-from shutil import move
 import requests
 
 
@@ -50,19 +49,26 @@ class Experiment(object):
     def __exit__(self, typ=None, value=None, traceback=None):
         self.xp_state.eg.serialize()
         original = os.getcwd()
+        # Each distinct file is stored once, the snapshot clones it
+        store = ObjectStore(os.path.join(self.xp_state.versioningDirectory, OBJECTS))
+        stat_cache = StatCache(os.path.join(self.xp_state.versioningDirectory, '.stat_cache',
+                                            self.xp_state.EXPERIMENT_NAME + '.json'))
         if os.path.exists(self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME):
-            move(self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME + '/.git', '/tmp/')
-            rmtree(self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME)
-            copytree(os.getcwd(), self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME)
-            move('/tmp/.git', self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME + '/.git')
+            # Only clones the files that changed since the last snapshot, and leaves .git in place
+            changed, removed = store.snapshot(os.getcwd(),
+                                              self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME,
+                                              stat_cache)
             os.chdir(self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME)
+            store.exclude(os.getcwd())
             repo = git.Repo(os.getcwd())
-            repo.git.add(A=True)
+            store.stage(repo, changed, removed)
             repo.index.commit('incremental commit')
         else:
-            copytree(os.getcwd(), self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME)
+            store.snapshot(os.getcwd(), self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME,
+                           stat_cache)
             os.chdir(self.xp_state.versioningDirectory + '/' + self.xp_state.EXPERIMENT_NAME)
             repo = git.Repo.init(os.getcwd())
+            store.exclude(os.getcwd())
             repo.git.add(A=True)
             repo.index.commit('initial commit')
         os.chdir(original)
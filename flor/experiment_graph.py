@@ -3,8 +3,146 @@
 import cloudpickle as dill
 from flor.shared_object_model.resource import Resource
 
+from array import array
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, List, Set
 
-class ExperimentGraph:
+import gc
+import io
+import json
+import os
+import pickle
+import sys
+
+GRAPH_FILE = 'experiment_graph.flor'
+LEGACY_GRAPH_FILE = 'experiment_graph.pkl'
+
+
+class GraphIndex:
+    """
+    Indexes derived from the edges of an experiment graph, computed on first use and cached until the graph changes
+        * A topological order
+        * The actions that produce the inputs of each action, and that consume its outputs
+    Reachability (ancestors, descendants, connected starts) is searched on demand, by breadth-first search:
+        a transitive closure would take memory quadratic in the size of the graph
+    Mixin for ExperimentGraph and CompactExperimentGraph, which call invalidate when they change.
+    """
+
+    def invalidate(self):
+        """
+        Clears the indexes. Called on every change made through node, light_node, edge and absorb.
+            Code that rewires d and b directly (the Aligner) calls it when done
+        """
+        self.order_index = None
+        self.actions_index = None
+
+    def topological_order(self) -> List:
+        """
+        :return: Every node, each after its parents
+        """
+        if getattr(self, 'order_index', None) is None:
+            in_degree = {v: len(self.b[v]) for v in self.d}
+            order = [v for v in in_degree if in_degree[v] == 0]
+            for v in order:
+                for child in self.d[v]:
+                    in_degree[child] -= 1
+                    if in_degree[child] == 0:
+                        order.append(child)
+            self.order_index = order
+        return self.order_index
+
+    def __actions_index__(self):
+        if getattr(self, 'actions_index', None) is None:
+            producing = {}
+            consuming = {}
+            for v in self.d:
+                if type(v).__name__ == "Action" or type(v).__name__ == "ActionLight":
+                    producing[v] = frozenset(p for i in self.b[v] for p in self.b[i])
+                    consuming[v] = frozenset(c for o in self.d[v] for c in self.d[o])
+            self.actions_index = producing, consuming
+        return self.actions_index
+
+    def producing_actions(self, action) -> FrozenSet:
+        """
+        :return: The actions that produce the inputs of action
+        """
+        return self.__actions_index__()[0][action]
+
+    def consuming_actions(self, action) -> FrozenSet:
+        """
+        :return: The actions that consume the outputs of action
+        """
+        return self.__actions_index__()[1][action]
+
+    def __reach__(self, sources, edges) -> Set:
+        """
+        :param edges: self.d to search forward, self.b backward
+        :return: The nodes reached from sources by at least one edge
+        """
+        reached = set([])
+        queue = list(sources)
+        while queue:
+            for w in edges[queue.pop()]:
+                if w not in reached:
+                    reached.add(w)
+                    queue.append(w)
+        return reached
+
+    def ancestors(self, v) -> Set:
+        """
+        What feeds v: the nodes with a path to v
+        """
+        if v not in self.d:
+            raise KeyError(v)
+        return self.__reach__([v, ], self.b)
+
+    def descendants(self, v) -> Set:
+        """
+        What v invalidates: the nodes with a path from v
+        """
+        if v not in self.d:
+            raise KeyError(v)
+        return self.__reach__([v, ], self.d)
+
+    def is_ancestor(self, u, v) -> bool:
+        """
+        Whether there is a path from u to v
+        """
+        return u in self.ancestors(v)
+
+    def levels(self) -> Dict:
+        """
+        :return: Dictionary mapping each node to the length of the longest path from a start to it
+        """
+        levels = {}
+        for v in self.topological_order():
+            levels[v] = max([levels[parent] + 1 for parent in self.b[v]], default=0)
+        return levels
+
+
+class ConnectedStarts(Mapping):
+    """
+    Helper class for GraphIndex
+    Read-only mapping from each node to the starts it is connected to (the starts among itself and its ancestors),
+        searched on each read
+    """
+
+    def __init__(self, graph: GraphIndex):
+        self.graph = graph
+
+    def __getitem__(self, v):
+        starts = self.graph.starts
+        return {u for u in self.graph.ancestors(v) | {v, } if u in starts}
+
+    def __iter__(self):
+        return iter(self.graph.d)
+
+    def __len__(self):
+        return len(self.graph.d)
+
+
+class ExperimentGraph(GraphIndex):
 
     def __init__(self):
         # forward edges
@@ -18,11 +156,9 @@ class ExperimentGraph:
         # Maps string to the object itself
         self.name_map = {}
         # Given a Flor Object, returns the relevant starts subset
-        self.connected_starts = {}
+        self.connected_starts = ConnectedStarts(self)
         self.actions_at_depth = {}
-
-        self.pre_absorb_d = None
-        self.pre_absorb_b = None
+        self.invalidate()
 
     def node(self, v):
         """
@@ -37,18 +173,12 @@ class ExperimentGraph:
             self.starts |= {v,}
             self.loc_map[v.getLocation()] = v
             self.name_map[v.name] = v
-            if v.parent is not None:
-                self.connected_starts[v] = self.connected_starts[v.parent]
-            else:
-                self.connected_starts[v] = {v, }
         else:
             if v.max_depth in self.actions_at_depth:
                 self.actions_at_depth[v.max_depth] |= {v, }
             else:
                 self.actions_at_depth[v.max_depth] = {v, }
-            self.connected_starts[v] = set([])
-            for each in v.in_artifacts:
-                self.connected_starts[v] |= self.connected_starts[each]
+        self.invalidate()
 
     def light_node(self, v):
         """
@@ -67,6 +197,7 @@ class ExperimentGraph:
                 self.actions_at_depth[v.max_depth] = {v, }
         else:
             self.name_map["{}{}".format(v.name, id(v))] = v
+        self.invalidate()
 
     def edge(self, u, v):
         assert u in self.d
@@ -74,26 +205,58 @@ class ExperimentGraph:
         self.d[u] |= {v, }
         self.b[v] |= {u, }
         self.starts -= {v, }
-        self.actions_at_depth[v.max_depth] -= {v, }
-        v.max_depth = max(v.max_depth, u.max_depth + 1)
-        if type(v).__name__ == "Action" or type(v).__name__ == "ActionLight":
-            if v.max_depth in self.actions_at_depth:
-                self.actions_at_depth[v.max_depth] |= {v, }
+        self.invalidate()
+
+        # Re-level v and, transitively, the descendants whose depth it raises
+        stack = [(u, v)]
+        while stack:
+            u, v = stack.pop()
+            if v.max_depth >= u.max_depth + 1:
+                continue
+            is_action = type(v).__name__ == "Action" or type(v).__name__ == "ActionLight"
+            if is_action:
+                self.actions_at_depth[v.max_depth] -= {v, }
+            v.max_depth = u.max_depth + 1
+            if is_action:
+                if v.max_depth in self.actions_at_depth:
+                    self.actions_at_depth[v.max_depth] |= {v, }
+                else:
+                    self.actions_at_depth[v.max_depth] = {v, }
+            for child in self.d[v]:
+                stack.append((v, child))
+
+    def __getstate__(self):
+        # The names keyed by id() (see light_node) are only valid in this process
+        state = self.__dict__.copy()
+        state['name_map'] = {}
+        state['light_names'] = []
+        for key, v in self.name_map.items():
+            if key == "{}{}".format(v.name, id(v)):
+                state['light_names'].append(v)
             else:
-                self.actions_at_depth[v.max_depth] = {v, }
+                state['name_map'][key] = v
+        return state
 
-    def serialize(self):
-        with open('experiment_graph.pkl', 'wb') as f:
-            dill.dump(self, f)
+    def __setstate__(self, state):
+        light_names = state.pop('light_names', [])
+        self.__dict__.update(state)
+        for v in light_names:
+            self.name_map["{}{}".format(v.name, id(v))] = v
+        self.invalidate()
 
-    def absorb(self, other_eg):
-        self.pre_absorb_d = self.d.copy()
-        self.pre_absorb_b = self.b.copy()
+    def serialize(self, path=None):
+        """
+        Writes the graph in the format of GraphFile
+        :param path: Defaults to GRAPH_FILE, in the current directory
+        """
+        GraphFile.write(self, path or GRAPH_FILE)
 
+    def absorb(self, other_eg):
         self.name_map.update(other_eg.name_map)
 
         self.d.update(other_eg.d)
         self.b.update(other_eg.b)
+        self.invalidate()
 
     def is_none_pending(self):
         action_set = set([])
@@ -111,7 +274,549 @@ class ExperimentGraph:
             raise TypeError("Uknown type: {}".format(type(obj)))
 
 
-def deserialize() -> ExperimentGraph:
-    with open('experiment_graph.pkl', 'rb') as f:
-        out = dill.load(f)
-    return out
+class CompactExperimentGraph(GraphIndex):
+    """
+    Alternative to ExperimentGraph for large expanded graphs, with the same node/edge/light_node API
+    Nodes get dense integer ids, in order of insertion. Edges are appended to two arrays of ids,
+        and read through d and b, which are built on first read as CSR arrays (offsets into an array of ids).
+    Node attributes (kind) are kept in arrays parallel to the nodes, and depths are derived from the topological order.
+    The graph only grows: the Executor runs on it, but the Consolidator, which rewires edges, does not.
+    """
+
+    ACTION, ARTIFACT, LITERAL = 0, 1, 2
+
+    def __init__(self):
+        self.nodes = []
+        # Maps the id() of each node to its integer id
+        self.ids = {}
+        self.kinds = bytearray()
+        # Edges, as parallel arrays of the integer ids of their endpoints
+        self.sources = array('i')
+        self.targets = array('i')
+        # Forward and backward edges, as mappings from node to the set of its neighbors, see Adjacency
+        self.d = Adjacency(self, forward=True)
+        self.b = Adjacency(self, forward=False)
+        # Loc_map only contains resources
+        self.loc_map = {}
+        # Maps string to the object itself
+        self.name_map = {}
+        # Given a Flor Object, returns the relevant starts subset
+        self.connected_starts = ConnectedStarts(self)
+        self.invalidate()
+
+    def __add__(self, v):
+        assert id(v) not in self.ids
+        self.ids[id(v)] = len(self.nodes)
+        self.nodes.append(v)
+        name = type(v).__name__
+        if name == "Action" or name == "ActionLight":
+            self.kinds.append(CompactExperimentGraph.ACTION)
+        elif "Artifact" in name:
+            self.kinds.append(CompactExperimentGraph.ARTIFACT)
+        else:
+            self.kinds.append(CompactExperimentGraph.LITERAL)
+        self.d.invalidate()
+        self.b.invalidate()
+        self.invalidate()
+
+    def node(self, v):
+        """
+        Experiment facing method
+        :param v: a Flor Object
+        :return:
+        """
+        self.__add__(v)
+        if issubclass(type(v), Resource):
+            self.loc_map[v.getLocation()] = v
+            self.name_map[v.name] = v
+
+    def light_node(self, v):
+        """
+        Engine facing method
+        :param v: The execution-relevant aspects of a Flor Object
+        :return:
+        """
+        self.__add__(v)
+
+    def edge(self, u, v):
+        u = self.ids[id(u)]
+        v = self.ids[id(v)]
+        self.sources.append(u)
+        self.targets.append(v)
+        self.d.invalidate()
+        self.b.invalidate()
+        self.invalidate()
+
+    def __contains__(self, v):
+        return id(v) in self.ids
+
+    @property
+    def starts(self):
+        """
+        a start is a Resource which has no incoming edge
+        """
+        return {self.nodes[i] for i in range(len(self.nodes)) if self.b.degree(i) == 0}
+
+    @property
+    def actions_at_depth(self):
+        actions_at_depth = {}
+        levels = self.levels()
+        for i in range(len(self.nodes)):
+            if self.kinds[i] == CompactExperimentGraph.ACTION:
+                actions_at_depth.setdefault(levels[self.nodes[i]], set([])).add(self.nodes[i])
+        return actions_at_depth
+
+    def serialize(self, path=None):
+        """
+        Writes the graph in the format of GraphFile
+        :param path: Defaults to GRAPH_FILE, in the current directory
+        """
+        GraphFile.write(self, path or GRAPH_FILE)
+
+    def __getstate__(self):
+        # The keys of ids are only valid in this process
+        state = self.__dict__.copy()
+        del state['ids']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ids = {id(v): i for i, v in enumerate(self.nodes)}
+
+    def is_none_pending(self):
+        return all(not self.nodes[i].pending for i in range(len(self.nodes))
+                   if self.kinds[i] == CompactExperimentGraph.ACTION)
+
+    def update_value(self, name, id_num, value):
+        obj = self.nodes[self.ids[id_num]]
+        if "Artifact" in type(obj).__name__:
+            obj.loc = value
+        elif "Literal" in type(obj).__name__:
+            obj.v = value
+        else:
+            raise TypeError("Uknown type: {}".format(type(obj)))
+
+
+class Adjacency(Mapping):
+    """
+    Helper class for CompactExperimentGraph
+    Read-only mapping from each node to the set of its successors (forward) or predecessors (backward)
+    Built on first read as CSR: the neighbors of node i are neighbors[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, graph: CompactExperimentGraph, forward: bool):
+        self.graph = graph
+        self.forward = forward
+        self.offsets = None
+        self.neighbors = None
+
+    def invalidate(self):
+        self.offsets = None
+        self.neighbors = None
+
+    def __build__(self):
+        if self.offsets is not None:
+            return
+        graph = self.graph
+        keys, values = (graph.sources, graph.targets) if self.forward else (graph.targets, graph.sources)
+        num_nodes = len(graph.nodes)
+
+        # Counting sort of the edges by key
+        counts = array('i', bytes(4 * (num_nodes + 1)))
+        for key in keys:
+            counts[key + 1] += 1
+        for i in range(num_nodes):
+            counts[i + 1] += counts[i]
+        neighbors = array('i', bytes(4 * len(keys)))
+        cursor = array('i', counts)
+        for key, value in zip(keys, values):
+            neighbors[cursor[key]] = value
+            cursor[key] += 1
+
+        # Drop repeated edges, the neighbors of a node are a set
+        if len(neighbors) > 0:
+            unique = array('i')
+            for i in range(num_nodes):
+                start = counts[i]
+                counts[i] = len(unique)
+                unique.extend(dict.fromkeys(neighbors[start:counts[i + 1]]))
+            counts[num_nodes] = len(unique)
+            neighbors = unique
+
+        self.offsets = counts
+        self.neighbors = neighbors
+
+    def degree(self, i: int) -> int:
+        self.__build__()
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def ids(self, i: int):
+        """
+        :return: The integer ids of the neighbors of the node with integer id i
+        """
+        self.__build__()
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, v):
+        if id(v) not in self.graph.ids:
+            raise KeyError(v)
+        nodes = self.graph.nodes
+        return frozenset(nodes[j] for j in self.ids(self.graph.ids[id(v)]))
+
+    def __contains__(self, v):
+        return id(v) in self.graph.ids
+
+    def __iter__(self):
+        return iter(self.graph.nodes)
+
+    def __len__(self):
+        return len(self.graph.nodes)
+
+
+class GraphFile:
+    """
+    Versioned binary format of the experiment graph of a Flor Plan, see serialize and deserialize
+    Layout: MAGIC, the length of the header (4 bytes, big endian), the header (JSON), then the sections.
+    The header holds the format version, the class of the graph, and the offset and length of each section:
+        * topology: JSON tables of the nodes. Nodes of the same type and fields share a table,
+            which lists the names of their scalar fields and references (to other nodes, by index) once,
+            then the indices of its nodes and a row of values for each
+        * edges: the edges as pairs of node indices, in an int32 array
+        * bindings: pickle of the other fields of the nodes (literal values, defaults), by node index
+        * code: cloudpickle of the functions of the actions
+        * state: pickle of the fields of the experiment state the Flor Objects share, with the nodes it holds
+            pickled by index (see __dumps__)
+    So structure, values and code are read separately, and only the sections a reader asks for are read.
+    """
+
+    MAGIC = b'FLORGRPH'
+    VERSION = 3
+
+    # Fields of the Flor Objects that reference other nodes, or the experiment state
+    REFERENCES = ('parent', 'in_artifacts', 'out_artifacts')
+    DROPPED = ('xp_state', )
+    # Fields of the experiment state bound to this process
+    STATE_DROPPED = ('eg', 'gc')
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(GraphFile.MAGIC)) != GraphFile.MAGIC:
+                raise ValueError("Not an experiment graph file: {}".format(path))
+            length = int.from_bytes(f.read(4), 'big')
+            self.header = json.loads(f.read(length).decode('utf-8'))
+            self.base = f.tell()
+        if self.header['version'] != GraphFile.VERSION:
+            raise ValueError("Experiment graph file {} has version {}, expected {}".format(
+                path, self.header['version'], GraphFile.VERSION))
+
+    @staticmethod
+    def is_graph_file(path) -> bool:
+        with open(path, 'rb') as f:
+            return f.read(len(GraphFile.MAGIC)) == GraphFile.MAGIC
+
+    @staticmethod
+    def write(eg, path):
+        """
+        :param eg: An ExperimentGraph, or a CompactExperimentGraph
+        """
+        with __gc_paused__():
+            GraphFile.__write__(eg, path)
+
+    @staticmethod
+    def __fields__(v) -> Dict[str, object]:
+        if hasattr(v, '__dict__'):
+            return vars(v)
+        # The Light objects are slotted
+        return {slot: getattr(v, slot) for cls in type(v).__mro__ for slot in getattr(cls, '__slots__', ())
+                if hasattr(v, slot)}
+
+    @staticmethod
+    def __write__(eg, path):
+        nodes = list(eg.d)
+        index = {v: i for i, v in enumerate(nodes)}
+        funcs = []
+        func_index = {}
+        tables = {}
+        bindings = {}
+        state = None
+
+        for i, v in enumerate(nodes):
+            scalars = {}
+            references = {}
+            others = {}
+            fields = GraphFile.__fields__(v)
+            for field, value in fields.items():
+                if field in GraphFile.DROPPED:
+                    state = state or value
+                elif field in GraphFile.REFERENCES:
+                    if type(value) == list:
+                        references[field] = [index[each] for each in value if each in index]
+                    else:
+                        references[field] = index.get(value)
+                elif field == 'func':
+                    if id(value) not in func_index:
+                        func_index[id(value)] = len(funcs)
+                        funcs.append(value)
+                    references[field] = func_index[id(value)]
+                elif value is None or type(value) in (str, int, float, bool):
+                    scalars[field] = value
+                else:
+                    others[field] = value
+            key = (type(v).__name__, tuple(scalars), tuple(references), 'xp_state' in fields)
+            if key not in tables:
+                tables[key] = {'type': key[0], 'scalars': list(key[1]), 'references': list(key[2]),
+                               'state': key[3], 'nodes': [], 'rows': []}
+            tables[key]['nodes'].append(i)
+            tables[key]['rows'].append(list(scalars.values()) + list(references.values()))
+            if others:
+                bindings[i] = others
+
+        edges = array('i')
+        for u in nodes:
+            for v in eg.d[u]:
+                edges.append(index[u])
+                edges.append(index[v])
+        if sys.byteorder != 'little':
+            edges.byteswap()
+
+        try:
+            pickled_bindings = pickle.dumps(bindings, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            pickled_bindings = dill.dumps(bindings)
+        topology = {'size': len(nodes), 'tables': list(tables.values()), 'starts': [index[v] for v in eg.starts]}
+        sections = [
+            ('topology', json.dumps(topology, separators=(',', ':')).encode('utf-8')),
+            ('edges', edges.tobytes()),
+            ('bindings', pickled_bindings),
+            ('code', dill.dumps(funcs)),
+            ('state', GraphFile.__dumps__(None if state is None else {
+                field: value for field, value in vars(state).items() if field not in GraphFile.STATE_DROPPED},
+                nodes)),
+        ]
+
+        header = {'version': GraphFile.VERSION, 'graph': type(eg).__name__, 'sections': {}}
+        offset = 0
+        for name, data in sections:
+            header['sections'][name] = [offset, len(data)]
+            offset += len(data)
+        header = json.dumps(header).encode('utf-8')
+
+        with open(path, 'wb') as f:
+            f.write(GraphFile.MAGIC)
+            f.write(len(header).to_bytes(4, 'big'))
+            f.write(header)
+            for _, data in sections:
+                f.write(data)
+
+    @staticmethod
+    def __dumps__(obj, nodes) -> bytes:
+        """
+        Pickles obj, with the nodes it references pickled as their index, see __loads__
+        """
+        ids = {id(v): i for i, v in enumerate(nodes)}
+
+        def persistent_id(o):
+            i = ids.get(id(o))
+            return i if i is not None and nodes[i] is o else None
+
+        for pickler in (pickle.Pickler, dill.CloudPickler):
+            f = io.BytesIO()
+            p = pickler(f, pickle.HIGHEST_PROTOCOL)
+            p.persistent_id = persistent_id
+            try:
+                p.dump(obj)
+                return f.getvalue()
+            except (pickle.PicklingError, TypeError, AttributeError):
+                if pickler is dill.CloudPickler:
+                    raise
+
+    @staticmethod
+    def __loads__(data: bytes, objects):
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        unpickler.persistent_load = objects.__getitem__
+        return unpickler.load()
+
+    def __section__(self, name) -> bytes:
+        offset, length = self.header['sections'][name]
+        with open(self.path, 'rb') as f:
+            f.seek(self.base + offset)
+            return f.read(length)
+
+    def topology(self):
+        """
+        :return: The number of nodes, their tables (see GraphFile), the indices of the starts,
+            and the edges (a flat array of pairs of indices)
+        """
+        with __gc_paused__():
+            topology = json.loads(self.__section__('topology').decode('utf-8'))
+        edges = array('i')
+        edges.frombytes(self.__section__('edges'))
+        if sys.byteorder != 'little':
+            edges.byteswap()
+        return topology['size'], topology['tables'], topology['starts'], edges
+
+    def bindings(self) -> Dict[int, Dict[str, object]]:
+        """
+        :return: Dictionary mapping the index of each node to its fields that are neither scalars nor references,
+            eg. the value of a literal
+        """
+        return {int(i): fields for i, fields in pickle.loads(self.__section__('bindings')).items()}
+
+    def literal_values(self) -> Dict[str, object]:
+        """
+        :return: Dictionary mapping the name of each literal to its value, read from topology and bindings
+        """
+        _, tables, _, _ = self.topology()
+        bindings = self.bindings()
+        values = {}
+        for table in tables:
+            if "Literal" not in table['type']:
+                continue
+            # Light literals keep their value in a slot
+            field = 'v' if table['type'] == "Literal" else '__value__'
+            name = table['scalars'].index('name')
+            value = table['scalars'].index(field) if field in table['scalars'] else None
+            for i, row in zip(table['nodes'], table['rows']):
+                values[row[name]] = bindings.get(i, {}).get(field, row[value] if value is not None else None)
+        return values
+
+    def code(self) -> List:
+        """
+        :return: The functions of the actions, indexed by the func reference of each action
+        """
+        return dill.loads(self.__section__('code'))
+
+    def load(self, bindings=True, code=True):
+        """
+        Rebuilds the experiment graph, with the Flor Objects sharing a new experiment state
+        :param bindings: Whether to read the values of the literals. Otherwise only scalar values are set
+        :param code: Whether to read the functions of the actions. Otherwise they are None
+        :return: An ExperimentGraph, or a CompactExperimentGraph if one was written
+        """
+        with __gc_paused__():
+            return self.__load__(bindings, code)
+
+    def __load__(self, bindings, code):
+        from flor.light_object_model import ActionLight, ArtifactLight, LiteralLight
+        from flor.object_model import Action, Artifact, Literal
+        from flor.stateful import State
+        classes = {'Action': Action, 'Artifact': Artifact, 'Literal': Literal,
+                   'ActionLight': ActionLight, 'ArtifactLight': ArtifactLight, 'LiteralLight': LiteralLight}
+
+        size, tables, starts, edges = self.topology()
+        values = self.bindings() if bindings else {}
+        funcs = self.code() if code else None
+
+        state = object.__new__(State)
+
+        objects = [None] * size
+        for table in tables:
+            cls = classes[table['type']]
+            for i in table['nodes']:
+                objects[i] = object.__new__(cls)
+
+        for table in tables:
+            names = table['scalars'] + table['references']
+            references = [(names.index(field), field) for field in table['references']]
+            # The Light objects are slotted: their rows are set through the slot descriptors
+            cls = classes[table['type']]
+            slotted = not hasattr(objects[table['nodes'][0]], '__dict__')
+            setters = [getattr(cls, field).__set__ for field in names] if slotted else None
+            defaults = {'v': None, 'default': None} if table['type'] == "Literal" else {}
+            for i, row in zip(table['nodes'], table['rows']):
+                for j, field in references:
+                    value = row[j]
+                    if field == 'func':
+                        row[j] = funcs[value] if funcs is not None else None
+                    elif type(value) == list:
+                        row[j] = [objects[k] for k in value]
+                    elif value is not None:
+                        row[j] = objects[value]
+                v = objects[i]
+                if slotted:
+                    for setter, value in zip(setters, row):
+                        setter(v, value)
+                    for field, value in values.get(i, {}).items():
+                        setattr(v, field, value)
+                else:
+                    fields = dict(defaults)
+                    fields.update(zip(names, row))
+                    if i in values:
+                        fields.update(values[i])
+                    if table['state']:
+                        fields['xp_state'] = state
+                    v.__dict__ = fields
+
+        # The nodes are allocated, so the state pickled with references to them loads
+        shared = GraphFile.__loads__(self.__section__('state'), objects)
+        if shared is not None:
+            state.__dict__.update(shared)
+            state.gc = None
+
+        if self.header['graph'] == "CompactExperimentGraph":
+            eg = CompactExperimentGraph()
+            for v in objects:
+                if issubclass(type(v), Resource):
+                    eg.node(v)
+                else:
+                    eg.light_node(v)
+            eg.sources = edges[0::2]
+            eg.targets = edges[1::2]
+            eg.d.invalidate()
+            eg.b.invalidate()
+            eg.invalidate()
+            state.eg = eg
+            return eg
+
+        eg = ExperimentGraph()
+        state.eg = eg
+        d = eg.d = {v: set([]) for v in objects}
+        b = eg.b = {v: set([]) for v in objects}
+        for u, v in zip(map(objects.__getitem__, edges[0::2]), map(objects.__getitem__, edges[1::2])):
+            d[u].add(v)
+            b[v].add(u)
+        eg.starts = {objects[i] for i in starts}
+
+        for v in objects:
+            if type(v) == Action or type(v) == ActionLight:
+                eg.actions_at_depth.setdefault(v.max_depth, set([])).add(v)
+            elif type(v) == ArtifactLight or type(v) == LiteralLight:
+                # As light_node names them
+                eg.name_map["{}{}".format(v.name, id(v))] = v
+            else:
+                eg.loc_map[v.getLocation()] = v
+                eg.name_map[v.name] = v
+        eg.invalidate()
+        return eg
+
+
+@contextmanager
+def __gc_paused__():
+    """
+    Reading and writing graph files only allocates, so cyclic garbage collection would only rescan the graph
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def deserialize(path=None, bindings=True, code=True) -> ExperimentGraph:
+    """
+    Reads the experiment graph written by ExperimentGraph.serialize or CompactExperimentGraph.serialize, see GraphFile
+    :param path: Defaults to GRAPH_FILE in the current directory, or to LEGACY_GRAPH_FILE for versions
+        committed before the format existed
+    :param bindings: Whether to read the values of the literals
+    :param code: Whether to read the functions of the actions
+    """
+    if path is None:
+        path = GRAPH_FILE if os.path.exists(GRAPH_FILE) else LEGACY_GRAPH_FILE
+    if not GraphFile.is_graph_file(path):
+        # Graphs were cloudpickled whole
+        with open(path, 'rb') as f:
+            return dill.load(f)
+    return GraphFile(path).load(bindings, code)
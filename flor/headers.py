@@ -6,7 +6,6 @@ from tqdm import tqdm
 import pandas as pd
 import tempfile
 import shutil
-import dill
 
 from typing import Dict, Union, Optional, List
 
@@ -15,6 +14,8 @@ from . import util
 from flor.stateful import State
 from flor.object_model.artifact import Artifact
 import flor.above_ground as ag
+from flor.experiment_graph import deserialize as eg_deserialize
+from flor.engine.object_store import ObjectStore, OBJECTS
 import subprocess
 
 def setNotebookName(name):
@@ -111,11 +112,12 @@ def versionSummaries(experimentName):
     original_dir = os.getcwd()
     processed_out = []
     os.chdir(State().versioningDirectory + '/' + experimentName)
+    store = ObjectStore(os.path.join(State().versioningDirectory, OBJECTS))
     for version in tqdm(getExperimentVersions(experimentName)):
-        util.runProc('git checkout ' + version)
+        store.checkout(os.getcwd(), version)
         df = util.loadArtifact(experimentName + '.pkl')
         processed_out.append((version, df))
-    util.runProc('git checkout master')
+    store.checkout(os.getcwd(), 'master')
     os.chdir(original_dir)
 
     for experiment_pair in processed_out:
@@ -130,13 +132,14 @@ def versionSummaries(experimentName):
 def checkoutArtifact(experimentName, trialNum, commitHash, fileName):
     original_dir = os.getcwd()
     os.chdir(State().versioningDirectory + '/' + experimentName)
-    util.runProc('git checkout ' + commitHash)
+    store = ObjectStore(os.path.join(State().versioningDirectory, OBJECTS))
+    store.checkout(os.getcwd(), commitHash)
     os.chdir(str(trialNum))
     warnings.filterwarnings("ignore")
     res = util.loadArtifact(fileName)
     warnings.filterwarnings("default")
     os.chdir('../')
-    util.runProc('git checkout master')
+    store.checkout(os.getcwd(), 'master')
     os.chdir(original_dir)
     return res
 
@@ -154,9 +157,10 @@ def fork(experimentName, commitHash, xp_state : State, outputDir = None):
 		raise Exception("Cannot fork from a dirty working directory")
 	ag.fork(xp_state, commitHash)
 	os.chdir(xp_state.versioningDirectory + '/' + experimentName)
-	util.runProc('git checkout ' + commitHash)
+	store = ObjectStore(os.path.join(xp_state.versioningDirectory, OBJECTS))
+	store.checkout(os.getcwd(), commitHash)
 	shutil.copytree(os.getcwd(), outputDir, True)  
-	util.runProc("git checkout master")
+	store.checkout(os.getcwd(), 'master')
 	os.chdir(original_dir)
 
 
@@ -168,6 +172,7 @@ def run(experimentName : str, artifactLoc : str,
         resourceMap = {}
 
         xpdir = State().versioningDirectory + '/' + experimentName
+        store = ObjectStore(os.path.join(State().versioningDirectory, OBJECTS))
 
         for currentPath in squashMap:
             currentPath2 = os.path.abspath(currentPath)
@@ -194,7 +199,7 @@ def run(experimentName : str, artifactLoc : str,
                        if len(x) >= 6 and x[0:6] == 'commit']
 
             for version in tqdm(commitHashes):
-                util.runProc('git checkout' + version)
+                store.checkout(xpdir, version)
 
                 record = {'version': version}
 
@@ -204,10 +209,9 @@ def run(experimentName : str, artifactLoc : str,
                 before = before.append([record,]).loc[:, ['version'] + [i for i in range(beforeTrialNum)]]
 
                 with tempfile.TemporaryDirectory() as tempdir:
-                    shutil.copytree(xpdir, tempdir + '/' + experimentName)
+                    shutil.copytree(xpdir, tempdir + '/' + experimentName, copy_function=shutil.copyfile)
                     with util.chinto(tempdir + '/' + experimentName + '/0' ):
-                        with open('experiment_graph.pkl', 'rb') as f:
-                            eg = dill.load(f)
+                        eg = eg_deserialize()
                         for node in eg.d:
                             if type(node) == Artifact and node.loc == artifactLoc:
                                 pullnode = node
@@ -222,9 +226,10 @@ def run(experimentName : str, artifactLoc : str,
 
                 # Now back in xpdir
                 util.runProc('git branch garbage')
-                util.runProc('git checkout master')
+                store.checkout(xpdir, 'master')
                 util.runProc('git merge garbage --no-edit')
                 util.runProc('git branch -d garbage')
+                store.restore(xpdir)
 
                 raw = util.runProc('git log').split('\n')
                 if len(raw) > 1 and 'Merge' in raw[1]:
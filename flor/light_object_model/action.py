@@ -1,17 +1,47 @@
 #!/usr/bin/env python3
 
+import inspect
+import sys
+
 
 class ActionLight:
+    # Slotted, since expansion creates one per trial. The execution options are read from the function
+    #   (see flor.func) rather than copied into every action
+    __slots__ = ['funcName', 'func', 'pending', 'max_depth']
+
+    resourceType = False
 
     def __init__(self, funcName, func):
-        self.funcName = funcName
+        self.funcName = sys.intern(funcName)
         self.func = func
 
-        self.resourceType = False
         self.pending = True
         self.max_depth = 0
 
+    @property
+    def options(self):
+        return getattr(self.func, '__florOptions__', {})
+
+    @property
+    def mode(self):
+        # Execution mode requested through flor.func, None defers to the mode of the pull
+        return self.options.get('mode')
+
+    @property
+    def coroutine(self):
+        options = self.options
+        return options['coroutine'] if 'coroutine' in options else inspect.iscoroutinefunction(self.func)
+
+    @property
+    def cores(self):
+        # Declared resource requirements, None if unknown
+        return self.options.get('cores')
+
+    @property
+    def rss(self):
+        return self.options.get('rss')
+
     def equals(self, other):
         # TODO: should we compare func?
         return (type(self) == type(other)
-                and self.funcName == other.funcName)
\ No newline at end of file
+                and self.funcName == other.funcName)
@@ -1,19 +1,20 @@
 #!/usr/bin/env python3
 
+import sys
+
 
 class ArtifactLight:
+    # Slotted, since expansion creates one per trial. Locations and names are interned, so trials share them
+    __slots__ = ['loc', 'name', 'max_depth']
+
+    resourceType = True
 
     def __init__(self, loc, name):
-        self.loc = loc
-        self.name = name
+        self.loc = sys.intern(loc) if type(loc) == str else loc
+        self.name = sys.intern(name)
 
-        self.resourceType = True
-        self.produced = False
         self.max_depth = 0
 
-    def set_produced(self):
-        self.produced = True
-
     def get_location(self):
         # TODO: S3 case, API call
         return id(self), self.loc
@@ -21,3 +22,10 @@ class ArtifactLight:
     def equals(self, other):
         return (type(self) == type(other)
                 and self.loc == other.loc)
+
+    def signature(self):
+        """
+        Hashable key such that equal artifacts have equal signatures, see equals
+        :return:
+        """
+        return type(self).__name__, self.loc
@@ -1,27 +1,63 @@
 #!/usr/bin/env python3
 
+import sys
+
+from flor import util
+
 
 class LiteralLight:
+    # Slotted, since expansion creates one per trial. Names are interned, and the Expander interns values
+    __slots__ = ['__value__', '__digest__', 'name', 'max_depth']
+
+    resourceType = True
 
     def __init__(self, v, name):
         self.v = v
-        self.name = name
+        self.name = sys.intern(name)
 
-        self.resourceType = True
-        self.produced = False
         self.max_depth = 0
 
-    def set_produced(self):
-        self.produced = True
+    @property
+    def v(self):
+        return self.__value__
+
+    @v.setter
+    def v(self, value):
+        self.__value__ = value
+        # Digest of the value, computed on first use, see digest
+        self.__digest__ = None
+
+    def digest(self):
+        """
+        Content digest of the value, cached until the value is set again. See util.digest
+        :return: Hex digest, or None if the value cannot be hashed
+        """
+        if self.__digest__ is None:
+            self.__digest__ = util.digest(self.v)
+        return self.__digest__
 
     def equals(self, other):
         """
         Not using __eq__ because we want the type hashable
+        Values are compared by digest, since == is elementwise on arrays and slow on large values
         :param other:
         :return:
         """
         return (
             type(self) == type(other) and
-            self.v == other.v and
-            self.name == other.name
+            self.name == other.name and
+            self.signature() == other.signature()
         )
+
+    def signature(self):
+        """
+        Hashable key such that equal literals have equal signatures, see equals
+        Builtin scalars are keyed by themselves, other values by their digest.
+            Values that cannot be hashed are never equal to another
+        :return:
+        """
+        if self.v is None or type(self.v) in (bool, int, float, str, bytes):
+            value = self.v
+        else:
+            value = (util.digest, self.digest() or id(self))
+        return type(self).__name__, self.name, value
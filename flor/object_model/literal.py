@@ -2,11 +2,16 @@
 
 from flor import util
 from flor.shared_object_model.resource import Resource
-from flor.engine.expander import Expander
 from flor.engine.consolidator import Consolidator
+from flor.engine.expander import Expander
 from flor.engine.executor import Executor
+from flor.engine.cache import Cache
+from flor.engine.journal import Journal
+from flor.engine.tracer import Tracer
+from flor.engine.history import History
 
 from uuid import uuid4
+import os
 
 
 class Literal(Resource):
@@ -53,9 +58,10 @@ class Literal(Resource):
     def __forEach__(self):
         """
         Makes self.v iterable, for multi-trial experiments
+        self.v may be a list, a tuple, a range or a 1-d numpy array. It is not copied
         :return:
         """
-        if not util.isIterable(self.v):
+        if not util.isSequence(self.v):
             raise TypeError("Cannot iterate over literal {}".format(self.v))
         self.__oneByOne__ = True
 
@@ -87,7 +93,56 @@ class Literal(Resource):
     def plot(self, rankdir=None):
         super().__plot__(self.name, "underline", rankdir)
 
-    def pull(self, manifest=None):
-        experiment_graphs = Expander.expand(self.xp_state.eg, self)
-        consolidated_graph = Consolidator.consolidate(experiment_graphs)
-        Executor.execute(consolidated_graph)
+    def pull(self, manifest=None, parallelism=1, mode='process', cores=None, rss=None, cache=False, resume=False,
+             trace=None, compact=False, shared=True):
+        """
+        Builds the literal, running every trial of the experiment
+        :param manifest: Unused
+        :param parallelism: Number of workers running independent actions concurrently,
+            and consolidating the trial graphs when not shared (see Consolidator.consolidate)
+        :param mode: 'process', 'thread' or 'async', how to run actions that do not set their own mode
+            In 'async', coroutine functions run concurrently on one event loop
+        :param cores: Number of cores actions may keep busy at once. Defaults to all the cores of the machine
+        :param rss: Resident memory actions may use at once, in MB. Defaults to the memory of the machine
+        :param cache: Whether to reuse the results of actions whose function and inputs did not change
+            since a previous pull. The cache is kept under the versioning directory.
+            Off by default: a cached action is not called, so the side effects of its function do not happen
+        :param resume: Whether to resume the last pull of this literal, if it was interrupted,
+            skipping the actions it completed
+        :param trace: If set, the path of a Chrome trace-event JSON file to record the timeline of the pull in.
+            Open it in Perfetto (ui.perfetto.dev) or chrome://tracing
+        :param compact: Whether to expand the trials into a CompactExperimentGraph, for sweeps too large
+            to fit in memory otherwise. Requires shared
+        :param shared: Whether to expand straight into the consolidated graph, each action once per distinct
+            combination of its inputs (see Expander.expand_shared). Otherwise every trial is expanded into
+            its own graph, and the Consolidator merges the graphs as they are expanded
+        """
+        if compact and not shared:
+            raise ValueError("A compact graph is only expanded with shared=True")
+        history = History(os.path.join(self.xp_state.versioningDirectory, '.history',
+                                       self.xp_state.EXPERIMENT_NAME + '.json'))
+        if cache:
+            cache = Cache(os.path.join(self.xp_state.versioningDirectory, '.cache'))
+        else:
+            cache = None
+        journal = Journal(os.path.join(self.xp_state.versioningDirectory, '.journal',
+                                       self.xp_state.EXPERIMENT_NAME + '.' + self.name), resume)
+        tracer = Tracer(trace) if trace is not None else None
+
+        num_trials = len(Expander.trial_space(self.xp_state.eg, self))
+        try:
+            if shared:
+                # Expansion and consolidation are one pass, there is no separate consolidation to trace
+                with Tracer.optional(tracer, 'expand shared', args={'trials': num_trials}):
+                    consolidated_graph = Expander.expand_shared(self.xp_state.eg, self, compact)
+            else:
+                # The trials are consolidated as they are expanded: Expander and Consolidator record a span
+                #   per graph, 'expand' and 'consolidate', so the time of each phase is the sum of its spans
+                consolidated_graph = Consolidator.consolidate(Expander.expand(self.xp_state.eg, self, tracer),
+                                                              parallelism, tracer=tracer)
+            with Tracer.optional(tracer, 'execute'):
+                Executor.execute(consolidated_graph, parallelism, mode, history, cores, rss, cache, journal, tracer)
+        finally:
+            if tracer is not None:
+                tracer.save()
+        journal.discard()
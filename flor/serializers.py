@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Registry of the serializers that read and write artifacts, by file extension and by Python type
+util.loadArtifact, the decorators and the action cache read and write through it,
+    so a format registered here is used by every path that stores or versions artifacts.
+    Register your own with register, eg. a columnar format for DataFrames:
+
+    class ParquetSerializer(Serializer):
+        def dump(self, obj, loc):
+            obj.to_parquet(loc)
+        def load(self, loc):
+            return pandas.read_parquet(loc)
+
+    register(ParquetSerializer(), extensions=['.parquet'], types=['pandas.DataFrame'])
+
+A file of an extension no serializer owns is written by the serializer of the type of the object,
+    and tagged by a hidden sidecar file (see SIDECAR) that names it, so load reads it back with the same serializer.
+
+.pkl files are standard pickles, which other tools read with pickle.load. Large numpy and pandas buffers are
+    written out of band, and mapped back on load, in .florpkl files (see PickleSerializer).
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import sys
+import threading
+
+from contextlib import contextmanager
+
+import cloudpickle as dill
+
+from flor import codec
+from flor import util
+
+# Pickles hold numpy and pandas buffers this large out of band: written as is, and mapped back on load
+OOB_SIZE = 2 ** 16
+PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+# Buffers are aligned in the file, so the arrays mapped on them are aligned
+ALIGNMENT = 64
+# Suffix of the sidecar file next to loc, '.' + name of loc + SIDECAR, naming the serializer that wrote loc
+SIDECAR = '.serializer'
+
+
+class Serializer:
+    """
+    Reads and writes the artifacts of one format
+    """
+
+    def dump(self, obj, loc):
+        raise NotImplementedError()
+
+    def load(self, loc):
+        raise NotImplementedError()
+
+
+class PickleSerializer(Serializer):
+    """
+    Pickles with protocol 5. With out_of_band, objects with large buffers (numpy arrays, pandas frames) are written as
+        MAGIC, the lengths of the sections, the pickle, then each buffer as is, with no intermediate copy.
+        On load the buffers are mapped copy-on-write, so the objects share the pages of the file.
+    Other objects are written as plain pickles, compressed when large (see flor.codec).
+    Objects that pickle cannot serialize (eg. lambdas) are written with cloudpickle.
+    Files are written beside loc then moved over it, since objects loaded from loc may still map it.
+    """
+
+    MAGIC = b'FLORPKL5'
+
+    def __init__(self, codec='auto', out_of_band=False):
+        """
+        :param codec: Codec of plain pickles, see flor.codec.open
+        :param out_of_band: Whether to write large buffers out of band, in a format pickle.load cannot read.
+            Otherwise every file is a plain pickle
+        """
+        self.codec = codec
+        self.out_of_band = out_of_band
+
+    def dump(self, obj, loc):
+        buffers = []
+
+        def buffer_callback(buffer):
+            # True keeps the buffer in the pickle
+            if buffer.raw().nbytes < OOB_SIZE:
+                return True
+            buffers.append(buffer)
+
+        try:
+            if PROTOCOL >= 5 and self.out_of_band:
+                data = pickle.dumps(obj, PROTOCOL, buffer_callback=buffer_callback)
+            else:
+                data = pickle.dumps(obj, PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            buffers = []
+            data = dill.dumps(obj)
+
+        with __staged__(loc) as staging:
+            if not buffers:
+                with codec.open(staging, 'wb', self.codec) as f:
+                    f.write(data)
+                return
+
+            raws = [buffer.raw() for buffer in buffers]
+            header = PickleSerializer.MAGIC + struct.pack('<QQ', len(data), len(raws)) + struct.pack(
+                '<{}Q'.format(len(raws)), *[raw.nbytes for raw in raws])
+            with open(staging, 'wb') as f:
+                f.write(header)
+                f.write(data)
+                for raw in raws:
+                    f.write(b'\0' * (-f.tell() % ALIGNMENT))
+                    f.write(raw)
+
+    def load(self, loc):
+        with open(loc, 'rb') as f:
+            if f.read(len(PickleSerializer.MAGIC)) == PickleSerializer.MAGIC:
+                length, count = struct.unpack('<QQ', f.read(16))
+                sizes = struct.unpack('<{}Q'.format(count), f.read(8 * count))
+                offset = f.tell()
+                # Copy-on-write, so the loaded objects are writable without writing to the file
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+            else:
+                view = None
+        if view is None:
+            return util.unpickle(loc)
+
+        data = view[offset:offset + length]
+        offset += length
+        buffers = []
+        for size in sizes:
+            offset += -offset % ALIGNMENT
+            buffers.append(view[offset:offset + size])
+            offset += size
+        return pickle.loads(data, buffers=buffers)
+
+
+class NumericSerializer(Serializer):
+    """
+    Numpy arrays as .npy or .npz files, or raw buffers (see util.RAW_DTYPES), loaded as read-only maps
+    Files are written beside loc then moved over it, as PickleSerializer does
+    """
+
+    def dump(self, obj, loc):
+        import numpy as np
+        ext = os.path.splitext(loc)[1]
+        with __staged__(loc) as staging, open(staging, 'wb') as f:
+            if ext == '.npy':
+                np.save(f, obj)
+            elif ext == '.npz':
+                if isinstance(obj, dict):
+                    np.savez(f, **obj)
+                else:
+                    np.savez(f, obj)
+            else:
+                np.ascontiguousarray(obj, dtype=util.RAW_DTYPES[ext]).tofile(f)
+
+    def load(self, loc):
+        return util.loadNumeric(loc)
+
+
+class TextSerializer(Serializer):
+    """
+    Text, one value per line, uncompressed. Loads the stripped lines, or the only line
+    """
+
+    def dump(self, obj, loc):
+        with codec.open(loc, 'w', 'none') as f:
+            if util.isIterable(obj):
+                for o in obj:
+                    f.write(str(o) + '\n')
+            else:
+                f.write(str(obj) + '\n')
+
+    def load(self, loc):
+        with codec.open(loc, 'r') as f:
+            x = [i.strip() for i in f.readlines() if i.strip()]
+        if len(x) == 1:
+            x = x[0]
+        return x
+
+
+# Serializers by extension, by type or name of type, and by name (see __name_of__)
+__by_extension__ = {}
+__by_type__ = {}
+__by_name__ = {}
+
+TEXT = TextSerializer()
+
+
+def register(serializer: Serializer, extensions=(), types=()):
+    """
+    Registers a serializer, replacing the ones registered for the same extensions and types
+    :param extensions: Extensions of the files it reads and writes, eg. ['.parquet']
+    :param types: Types of the objects it writes to files of extensions no serializer owns,
+        as types or importable names (eg. 'pandas.DataFrame', so pandas need not be imported)
+    """
+    for extension in extensions:
+        __by_extension__[extension.lower()] = serializer
+    for t in types:
+        __by_type__[t] = serializer
+    __by_name__[__name_of__(serializer)] = serializer
+
+
+def __name_of__(serializer: Serializer) -> str:
+    return type(serializer).__module__ + '.' + type(serializer).__qualname__
+
+
+def __sidecar__(loc) -> str:
+    return os.path.join(os.path.dirname(loc), '.' + os.path.basename(loc) + SIDECAR)
+
+
+@contextmanager
+def __staged__(loc):
+    """
+    Path of a hidden file beside loc, with the same extension, moved over loc once written
+    Replacing loc instead of truncating it leaves the objects that map loc (see PickleSerializer.load,
+        util.loadNumeric) reading the file they were loaded from, and readers of loc never see a partial file
+    """
+    staging = os.path.join(os.path.dirname(loc),
+                           '.{}.{}.{}'.format(os.getpid(), threading.get_ident(), os.path.basename(loc)))
+    try:
+        yield staging
+        os.replace(staging, loc)
+    finally:
+        if os.path.lexists(staging):
+            os.remove(staging)
+
+
+def __resolve__(t):
+    """
+    :return: The type t, or the type named t if its module was imported, else None
+    """
+    if type(t) != str:
+        return t
+    module, _, name = t.rpartition('.')
+    resolved = sys.modules.get(module)
+    for part in name.split('.'):
+        resolved = getattr(resolved, part, None)
+    return resolved
+
+
+def lookup(loc, obj=None) -> Serializer:
+    """
+    :param obj: The object to write, if writing
+    :return: The serializer of the extension of loc, or else of the type of obj when writing,
+        or of the sidecar of loc when reading, or else TEXT
+    """
+    extension = os.path.splitext(loc)[1].lower()
+    if extension in __by_extension__:
+        return __by_extension__[extension]
+    if obj is None:
+        sidecar = __sidecar__(loc)
+        if not os.path.exists(sidecar):
+            return TEXT
+        with open(sidecar, 'r') as f:
+            name = f.read().strip()
+        if name not in __by_name__:
+            raise ValueError("{} was written by the serializer {}, which is not registered".format(loc, name))
+        return __by_name__[name]
+    if __by_type__:
+        registered = [(__resolve__(t), serializer) for t, serializer in __by_type__.items()]
+        for t in type(obj).__mro__:
+            for r, serializer in registered:
+                if r is t:
+                    return serializer
+    return TEXT
+
+
+def dump(obj, loc):
+    serializer = lookup(loc, obj)
+    serializer.dump(obj, loc)
+    sidecar = __sidecar__(loc)
+    if serializer is not TEXT and os.path.splitext(loc)[1].lower() not in __by_extension__:
+        with open(sidecar, 'w') as f:
+            f.write(__name_of__(serializer) + '\n')
+    elif os.path.exists(sidecar):
+        os.remove(sidecar)
+
+
+def load(loc):
+    return lookup(loc).load(loc)
+
+
+register(PickleSerializer(), extensions=['.pkl'])
+register(PickleSerializer(out_of_band=True), extensions=['.florpkl'])
+register(NumericSerializer(), extensions=['.npy', '.npz'] + list(util.RAW_DTYPES))
+# Text formats stay text, for the tools that read them by extension
+register(TEXT, extensions=['.txt', '.csv', '.tsv'])
@@ -18,7 +18,8 @@ class Resource(object):
     def getLocation(self):
         raise NotImplementedError("Abstract method Resource.getLocation must be overridden")
 
-    def pull(self, manifest=None):
+    def pull(self, manifest=None, parallelism=1, mode='process', cores=None, rss=None, cache=False, resume=False,
+             trace=None, compact=False, shared=True):
         pass
 
     def peek(self, head=25, manifest=None, bindings=None, func = lambda x: x):
@@ -3,7 +3,15 @@
 import subprocess
 import pickle
 import hashlib
+import io
 import os
+import struct
+import sys
+import zipfile
+
+from collections.abc import Mapping
+
+from flor import codec as codecs
 
 
 def isLoc(loc):
@@ -36,6 +44,14 @@ def isCsv(loc):
         return False
 
 
+# Numeric types of raw buffer artifacts, by extension. Little endian, as numpy.ndarray.tofile writes on most machines
+RAW_DTYPES = {
+    '.i8': '<i1', '.i16': '<i2', '.i32': '<i4', '.i64': '<i8',
+    '.u8': '<u1', '.u16': '<u2', '.u32': '<u4', '.u64': '<u8',
+    '.f32': '<f4', '.f64': '<f8',
+}
+
+
 def isIpynb(loc):
     return loc.split('.')[1] == 'ipynb'
 
@@ -44,6 +60,13 @@ def isIterable(obj):
     return type(obj) == list or type(obj) == tuple
 
 
+def isSequence(obj):
+    """
+    Whether obj can be indexed in constant time without being copied: lists, tuples, ranges and 1-d numpy arrays
+    """
+    return isIterable(obj) or type(obj) == range or (type(obj).__name__ == 'ndarray' and obj.ndim == 1)
+
+
 def runProc(bashCommand):
     process = subprocess.Popen(bashCommand.split(), stdout=subprocess.PIPE)
     output, error = process.communicate()
@@ -53,13 +76,16 @@ def runProc(bashCommand):
         return output
 
 
-def pickleTo(obj, loc):
-    with open(loc, 'wb') as f:
+def pickleTo(obj, loc, codec='auto'):
+    """
+    :param codec: 'auto' compresses large pickles only, or 'none', 'gzip' or 'lzma', see flor.codec
+    """
+    with codecs.open(loc, 'wb', codec) as f:
         pickle.dump(obj, f)
 
 
 def unpickle(loc):
-    with open(loc, 'rb') as f:
+    with codecs.open(loc, 'rb') as f:
         x = pickle.load(f)
     return x
 
@@ -78,17 +104,83 @@ def isNumber(s):
         return False
 
 
+def isNumeric(loc):
+    return os.path.splitext(loc)[1] in ('.npy', '.npz') or os.path.splitext(loc)[1] in RAW_DTYPES
+
+
+def loadNumeric(loc):
+    """
+    Maps a numeric artifact read-only instead of reading it, so only the pages of the slices read are loaded
+    .npy files load as numpy memmaps, .npz files as an NpzArtifact, and raw buffers (see RAW_DTYPES) as 1-d memmaps.
+    Compressed .npy and .npz files (see flor.codec) cannot be mapped, and are read.
+        Raw buffers have no magic number, so any of their bytes are data: they are never decompressed
+    """
+    import numpy as np
+    ext = os.path.splitext(loc)[1]
+    if ext in ('.npy', '.npz') and codecs.detect(loc) is not None:
+        with codecs.open(loc, 'rb') as f:
+            if ext == '.npy':
+                return np.load(f)
+            return dict(np.load(io.BytesIO(f.read())))
+    if ext == '.npy':
+        return np.load(loc, mmap_mode='r')
+    elif ext == '.npz':
+        return NpzArtifact(loc)
+    elif os.path.getsize(loc) == 0:
+        # mmap cannot map an empty file
+        return np.empty(0, dtype=RAW_DTYPES[ext])
+    return np.memmap(loc, dtype=RAW_DTYPES[ext], mode='r')
+
+
+class NpzArtifact(Mapping):
+    """
+    The arrays of a .npz artifact, by name, mapped read-only on access
+    Arrays stored uncompressed (numpy.savez) are mapped from the archive,
+        compressed ones (numpy.savez_compressed) are read.
+    """
+
+    def __init__(self, loc):
+        self.loc = loc
+        with zipfile.ZipFile(loc) as archive:
+            self.members = {(info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename): info
+                            for info in archive.infolist()}
+
+    def __getitem__(self, name):
+        import numpy as np
+        info = self.members[name]
+        if info.compress_type == zipfile.ZIP_STORED:
+            with open(self.loc, 'rb') as f:
+                # The data of a member follows its local header, whose extra field may differ from the central one
+                f.seek(info.header_offset)
+                header = f.read(30)
+                name_length, extra_length = struct.unpack('<HH', header[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                read_header = {(1, 0): np.lib.format.read_array_header_1_0,
+                               (2, 0): np.lib.format.read_array_header_2_0}.get(version)
+                if read_header is not None:
+                    shape, fortran_order, dtype = read_header(f)
+                    if not dtype.hasobject and 0 not in shape:
+                        return np.memmap(self.loc, dtype=dtype, mode='r', shape=shape,
+                                         order='F' if fortran_order else 'C', offset=f.tell())
+        with np.load(self.loc) as archive:
+            return archive[name]
+
+    def __iter__(self):
+        return iter(self.members)
+
+    def __len__(self):
+        return len(self.members)
+
+
 def loadArtifact(loc):
-    if isPickle(loc):
-        x = unpickle(loc)
-    elif isLoc(loc):
-        with open(loc, 'r') as f:
-            x = [i.strip() for i in f.readlines() if i.strip()]
-        if len(x) == 1:
-            x = x[0]
-    else:
+    """
+    Loads an artifact with the serializer registered for it, see flor.serializers
+    """
+    from flor import serializers
+    if not isLoc(loc):
         raise NotImplementedError("Don't know how to load that file.")
-    return x
+    return serializers.load(loc)
 
 
 def master_pop(literals):
@@ -112,13 +204,91 @@ def activate(pseudoArtifact):
             activate(in_art)
 
 
-def md5(fname):
-    # Credit: https://stackoverflow.com/a/3431838
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+def md5(fname, versioningDirectory=None):
+    return checksums([fname, ], versioningDirectory=versioningDirectory)[fname]
+
+
+def checksums(fnames, algorithm='md5', versioningDirectory=None):
+    """
+    Checksums of many files, hashed concurrently, and cached by their stat under the versioning directory
+        so unchanged files are not read
+    :param algorithm: 'md5' or 'blake2b', see Checksummer
+    :param versioningDirectory: The versioningDirectory of the experiment state. By default, the one of State()
+    :return: Dictionary mapping each file name to its checksum
+    """
+    from flor.engine.checksum import Checksummer
+    if versioningDirectory is None:
+        from flor.stateful import State
+        versioningDirectory = State().versioningDirectory
+    return Checksummer.service(versioningDirectory, algorithm).checksums(fnames)
+
+
+def digest(obj):
+    """
+    Content digest of a memory-resident value, for comparing values without ==
+    Numpy arrays are hashed from their buffer without copying it (when contiguous), pandas objects column by column,
+        and containers element by element. Anything else is hashed from its pickle.
+    Numpy and pandas are only looked up if already imported, since otherwise obj cannot be one of theirs.
+    :return: Hex digest, or None if obj cannot be hashed
+    """
+    hash_value = hashlib.blake2b(digest_size=16)
+    try:
+        __digest__(obj, hash_value)
+    except (pickle.PicklingError, TypeError, AttributeError, ValueError):
+        return None
+    return hash_value.hexdigest()
+
+
+def __digest__(obj, hash_value):
+    """
+    Subroutine of digest, feeds obj to hash_value
+    Every value is prefixed with its type, and containers with their length, so distinct values do not collide
+    """
+    np = sys.modules.get('numpy')
+    pd = sys.modules.get('pandas')
+    hash_value.update(type(obj).__name__.encode('utf-8'))
+    if obj is None or type(obj) in (bool, int, float, complex):
+        hash_value.update(repr(obj).encode('utf-8'))
+    elif type(obj) == str:
+        hash_value.update(obj.encode('utf-8', 'surrogatepass'))
+    elif type(obj) in (bytes, bytearray):
+        hash_value.update(obj)
+    elif type(obj) in (list, tuple):
+        hash_value.update(str(len(obj)).encode('utf-8'))
+        for each in obj:
+            __digest__(each, hash_value)
+    elif type(obj) in (dict, set, frozenset):
+        # Unordered: hash the sorted digests of the items
+        items = obj.items() if type(obj) == dict else obj
+        hash_value.update(str(len(obj)).encode('utf-8'))
+        digests = []
+        for item in items:
+            item_hash_value = hashlib.blake2b(digest_size=16)
+            __digest__(item, item_hash_value)
+            digests.append(item_hash_value.digest())
+        for each in sorted(digests):
+            hash_value.update(each)
+    elif np is not None and isinstance(obj, np.ndarray):
+        hash_value.update("{}{}".format(obj.dtype.str, obj.shape).encode('utf-8'))
+        if obj.dtype.hasobject:
+            for each in obj.flat:
+                __digest__(each, hash_value)
+        else:
+            # A view of the buffer as bytes, copied only if obj is not contiguous
+            hash_value.update(np.ascontiguousarray(obj).reshape(-1).view(np.uint8))
+    elif np is not None and isinstance(obj, np.generic):
+        __digest__(np.asarray(obj), hash_value)
+    elif pd is not None and isinstance(obj, pd.DataFrame):
+        __digest__(list(obj.columns), hash_value)
+        __digest__(obj.index, hash_value)
+        for column in range(obj.shape[1]):
+            __digest__(obj.iloc[:, column], hash_value)
+    elif pd is not None and isinstance(obj, (pd.Series, pd.Index)):
+        hash_value.update(str(obj.dtype).encode('utf-8'))
+        __digest__(obj.name, hash_value)
+        __digest__(obj.to_numpy(), hash_value)
+    else:
+        hash_value.update(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
 
 
 def plating(in_artifacts):